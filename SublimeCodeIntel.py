@@ -32,17 +32,31 @@ NAME = "SublimeCodeIntel"
 VERSION = "3.0.0-rc.1"
 
 import os
-import re
+import time
 import logging
-import textwrap
 import threading
+import itertools
 from collections import deque
 
 import sublime
 import sublime_plugin
 
-from .libs.codeintel import CodeIntel, CodeIntelBuffer, logger as codeintel_logger, logger_level as codeintel_logger_level
+from .libs.codeintel import CodeIntel, CodeIntelBuffer, CodeIntelManager, logger as codeintel_logger, logger_level as codeintel_logger_level
 from .settings import Settings, SettingTogglerCommandMixin
+from .buffers import TextMirror, TextWindow, BufferRegistry
+from .scheduler import TriggerScheduler
+from .triggers import TriggerFilter
+from .completions import CompletionCache, CompletionFormatter, CompletionStream
+from .calltips import CalltipCache
+from .definitions import DefinitionCache
+from .identifiers import IdentifierIndex
+from .tracing import Tracer
+from .status import StatusQueue, NotificationAggregator
+from .indexer import Indexer
+from .watcher import Watcher
+from .startup import Startup
+from .pool import CodeIntelPool
+from .pathmatch import PathMatcher
 
 logger_name = 'CodeIntel'
 logger_level = logging.WARNING  # WARNING
@@ -77,25 +91,37 @@ EXCLUDE_PATHS_MAP = {
     'C++': 'cppExcludePaths',
 }
 
+# Written when the CodeIntel database is created:
+DATABASE_VERSION = os.path.expanduser(os.path.join('~', '.codeintel', 'db', 'VERSION'))
+
 
 def unique(lst):
     used = set()
     return [x for x in lst if x not in used and (used.add(x) or True)]
 
 
+def run_async(fn):
+    """Run fn() out of the UI thread."""
+    if hasattr(sublime, 'set_timeout_async'):
+        sublime.set_timeout_async(fn, 0)
+    else:
+        thread = threading.Thread(target=fn, name='CodeIntel Async')
+        thread.daemon = True
+        thread.start()
+
+
 class CodeintelHandler(object):
     HISTORY_SIZE = 64
     MAX_FILESIZE = 1 * 1024 * 1024   # 1MB
     jump_history_by_window = {}  # map of window id -> deque([], HISTORY_SIZE)
-
-    status_msg = {}
-    status_lineno = {}
-    status_lock = threading.Lock()
+    text_mirrors = {}  # map of buffer id -> TextMirror
+    text_windows = {}  # map of buffer id -> TextWindow (for large files)
+    completion_formatters = {}  # map of (lang, type, function, limit) -> CompletionFormatter
 
     def __init__(self, *args, **kwargs):
         self.log = logging.getLogger(logger_name + '.' + self.__class__.__name__)
         super(CodeintelHandler, self).__init__(*args, **kwargs)
-        ci.add_observer(self)
+        pool.add_observer(self)
 
     @property
     def window(self):
@@ -141,55 +167,21 @@ class CodeintelHandler(object):
                 msg = repr(msg)
         msg = msg.strip()
 
-        CodeintelHandler.status_lock.acquire()
-        try:
-            CodeintelHandler.status_msg.setdefault(lid, [None, None, 0])
-            if msg == CodeintelHandler.status_msg[lid][1]:
-                return
-            CodeintelHandler.status_msg[lid][2] += 1
-            order = CodeintelHandler.status_msg[lid][2]
-        finally:
-            CodeintelHandler.status_lock.release()
-
-        def _set_status():
-            is_warning = 'warning' in lid
-            if not is_warning:
-                view_sel = view.sel()
-                lineno = view.rowcol(view_sel[0].end())[0] if view_sel else 0
-            CodeintelHandler.status_lock.acquire()
-            try:
-                current_type, current_msg, current_order = CodeintelHandler.status_msg.get(lid, [None, None, 0])
-                if msg != current_msg and order == current_order:
-                    _logger_obj = getattr(logger, ltype, None) if logger_obj is None else logger_obj
-                    if _logger_obj:
-                        _logger_obj(msg)
-                    if ltype != 'debug':
-                        view.set_status(lid, "%s %s: %s" % (lid, ltype.capitalize(), msg.rstrip('.')))
-                        CodeintelHandler.status_msg[lid] = [ltype, msg, order]
-                    if not is_warning:
-                        CodeintelHandler.status_lineno[lid] = lineno
-            finally:
-                CodeintelHandler.status_lock.release()
-
-        def _erase_status():
-            CodeintelHandler.status_lock.acquire()
-            try:
-                if msg == CodeintelHandler.status_msg.get(lid, [None, None, 0])[1]:
-                    view.erase_status(lid)
-                    CodeintelHandler.status_msg[lid][1] = None
-                    if lid in CodeintelHandler.status_lineno:
-                        del CodeintelHandler.status_lineno[lid]
-            finally:
-                CodeintelHandler.status_lock.release()
-
-        if msg:
-            sublime.set_timeout(_set_status, delay or 0)
-            sublime.set_timeout(_erase_status, timeout)
-        else:
-            sublime.set_timeout(_erase_status, delay or 0)
+        if not msg:
+            status_queue.post(view, lid, None, delay)
+            return
+
+        def _log():
+            _logger_obj = getattr(logger, ltype, None) if logger_obj is None else logger_obj
+            if _logger_obj:
+                _logger_obj(msg)
+
+        if ltype == 'debug':
+            # Debug messages are only logged
+            _log()
+            return
 
-    def pos2bytes(self, content, pos):
-        return len(content[:pos].encode('utf-8'))
+        status_queue.post(view, lid, "%s %s: %s" % (lid, ltype.capitalize(), msg.rstrip('.')), delay, timeout, _log)
 
     def guess_language(self, view, path):
         language = os.path.splitext(os.path.basename(view.settings().get('syntax')))[0]
@@ -222,108 +214,146 @@ class CodeintelHandler(object):
             return
 
         view_size = view.size()
-        if view.size() > self.MAX_FILESIZE:
-            logger.warn("File %r has size greater than 1MB (%d)", path, view_size)
+        large_file_threshold = settings.get('large_file_threshold', self.MAX_FILESIZE, lang=lang)
+        large_file = view_size > large_file_threshold
+        if large_file and not settings.get('large_file_mode', False, lang=lang):
+            logger.warn("File %r has size greater than %d (%d)", path, large_file_threshold, view_size)
             return
 
         logger.debug("buf_from_view: %r, %r? yes", path, lang)
 
         vid = view.id()
-        try:
-            buf = ci.buffers[vid]
-        except KeyError:
+        service = pool.service(lang)
+        if service is None:
+            logger.debug("buf_from_view: %r, %r? no: CodeIntel worker starting", path, lang)
+            return
+        buf = ci.buffers.get(vid)
+        if buf is None or buf.service is not service:
             logger.debug("creating new %s document %s", lang, path)
-            buf = CodeIntelBuffer(ci, vid=vid)
+            buf = CodeIntelBuffer(service, vid=vid)
+            buf.version = None
             ci.buffers[vid] = buf
 
+        bid = view.buffer_id()
+        try:
+            mirror = CodeintelHandler.text_mirrors[bid]
+        except KeyError:
+            mirror = CodeintelHandler.text_mirrors[bid] = TextMirror()
+
         sel = view_sel[0]
         original_pos = sel.end()
         lpos = view.line(sel).begin()
 
-        text_in_current_line = view.substr(sublime.Region(lpos, original_pos + 1))
-        text = view.substr(sublime.Region(0, view_size))
+        text = mirror.sync(view)
+        text_in_current_line = text[lpos:original_pos + 1]
+
+        if large_file:
+            # Send only a window around the cursor plus an outline of the rest:
+            window_size = settings.get('large_file_window', 262144, lang=lang)
+            text_window = CodeintelHandler.text_windows.get(bid)
+            if text_window is None or text_window.size != window_size:
+                text_window = CodeintelHandler.text_windows[bid] = TextWindow(window_size)
+            buf.text, pos = text_window.sync(mirror, original_pos)
+            buf.version = mirror.version
+        else:
+            CodeintelHandler.text_windows.pop(bid, None)
+            text_window = None
 
-        # Get encoded content and current position
-        pos = self.pos2bytes(text, original_pos)
+            # Get encoded content and current position
+            pos = mirror.pos2bytes(original_pos)
 
+            # Only hand the text over again when the buffer changed:
+            if mirror.version is None or buf.version != mirror.version:
+                buf.version = mirror.version
+                buf.text = text
+
+        identifier_index.update(bid, mirror)
+
+        buf.mirror = mirror
+        buf.text_window = text_window
+        buf.buffer_id = bid
         buf.lang = lang
+        if file_name:
+            indexer.learn(file_name, lang)
         buf.path = path
-        buf.text = text
         buf.pos = pos
         buf.text_in_current_line = text_in_current_line
         buf.original_pos = original_pos
 
-        prefs = settings.get_prefs(lang)
-
         if settings.get('scan_files_in_project', lang=lang):
-            window = sublime.active_window()
-            extra_paths_name = EXTRA_PATHS_MAP.get(lang)
-            extra_paths = prefs.get(extra_paths_name, '').split(os.pathsep)
-            exclude_paths_name = EXCLUDE_PATHS_MAP.get(lang)
-            exclude_paths = prefs.get(exclude_paths_name, '').split(os.pathsep)
-            for f in window.folders():
-                f = os.path.normcase(os.path.normpath(os.path.expanduser(f))).rstrip(os.sep)
-                if f not in exclude_paths and f not in extra_paths:
-                    extra_paths.append(f)
-            if extra_paths:
-                prefs[extra_paths_name] = os.pathsep.join(extra_paths)
+            window = view.window() or sublime.active_window()
+            prefs = settings.get_project_prefs(lang, window.folders() if window else ())
+        else:
+            prefs = settings.get_prefs(lang)
 
         buf.prefs = prefs
 
+        buffer_registry.touch(vid, buf)
+
         return buf
 
-    def format_completions_by_language(self, cplns, lang, text_in_current_line, type):
+    @staticmethod
+    def release_buffer(vid, buf):
+        """Drop what's kept for the buffer of a view evicted from the registry."""
+        text_window = CodeintelHandler.text_windows.get(buf.buffer_id)
+        if text_window is not None and text_window is buf.text_window:
+            del CodeintelHandler.text_windows[buf.buffer_id]
+        identifier_index.forget(buf.buffer_id)
+
+    def identifier_completions(self, view, buf, prefix):
+        """Return completions for prefix from the identifier index, or None."""
+        if not prefix:
+            return
+        if buf:
+            lang = buf.lang
+        else:
+            lang = self.guess_language(view, view.file_name())
+            if lang not in (ci.languages or settings.get('language_settings', {})):
+                return
+        if not settings.get('live', False, lang=lang) or not settings.get('identifier_completions', True, lang=lang):
+            return
+        bid = view.buffer_id()
+        if not buf:
+            try:
+                mirror = CodeintelHandler.text_mirrors[bid]
+            except KeyError:
+                mirror = CodeintelHandler.text_mirrors[bid] = TextMirror()
+            mirror.sync(view)
+            identifier_index.update(bid, mirror)
+        return identifier_index.completions(prefix, bid) or None
+
+    def completion_formatter(self, lang, text_in_current_line, type):
         function = None if 'import ' in text_in_current_line else 'function'
+        limit = settings.get('max_completions', None, lang=lang)
+        key = (lang, type, function, limit)
+        try:
+            return CodeintelHandler.completion_formatters[key]
+        except KeyError:
+            formatter = CodeintelHandler.completion_formatters[key] = CompletionFormatter(lang, type, function, limit)
+            return formatter
 
-        def get_desc(c):
-            return c[2] if len(c) > 2 else c[1]
-
-        def get_type(c):
-            return c[0].title()
-
-        if lang == 'PHP' and type != 'object-members':
-            def get_name(c):
-                name = c[1]
-                if c[0] == 'variable':
-                    name = "$" + name
-                name = name.replace("$", "\\$")
-                if c[0] == function:
-                    name += "($0)"
-                return name
-
-        elif lang == 'ECMAScript':
-            def get_name(c):
-                name = c[1]
-                name = name.replace("$", "\\$")
-                if c[0] == 'attribute':
-                    name += "=$0 "
-                elif c[0] == function:
-                    name += "($0)"
-                return name
-
-        else:
-            def get_name(c):
-                name = c[1]
-                name = name.replace("$", "\\$")
-                if c[0] == function:
-                    name += "($0)"
-                return name
-
-        def sorter(c):
-            return {
-                'import': '_',
-                'attribute': '__',
-                'variable': '__',
-                'function': '___',
-            }.get(c[0].lower(), c[0]), c[1]
-
-        return [('%s\t〔%s〕' % (get_desc(c), get_type(c)), get_name(c)) for c in sorted(cplns, key=sorter)]
+    def format_completions_by_language(self, cplns, lang, text_in_current_line, type):
+        return self.completion_formatter(lang, text_in_current_line, type).format(cplns)
 
     # Handlers follow
 
     def on_document_scanned(self, buf):
         """Handler callback for scan_document"""
 
+    def bytes2pos(self, buf, offset):
+        """
+        Map a UTF-8 byte offset in the text sent to the backend back to
+        a position in the view. Returns None if it can't be mapped.
+
+        """
+        mirror = getattr(buf, 'mirror', None)
+        if mirror is None or mirror.text is None:
+            return
+        text_window = getattr(buf, 'text_window', None)
+        if text_window is not None:
+            return text_window.bytes2pos(mirror, offset)
+        return mirror.bytes2pos(offset)
+
     def on_get_calltip_range(self, buf, start, end):
         pass
 
@@ -338,7 +368,18 @@ class CodeintelHandler(object):
             self.set_status(message)
         sublime.set_timeout(_set_status_message, 0)
 
-    def set_call_tip_info(self, buf, calltip, explicit, trg):
+    def traced(self, callback, trace):
+        """Wrap a UI thread callback so its dispatch and render times are traced."""
+        if trace is None:
+            return callback
+
+        def _traced():
+            trace.mark('dispatch')
+            callback()
+            trace.finish('render')
+        return _traced
+
+    def set_call_tip_info(self, buf, calltip, explicit, trg, trace=None):
         def _set_call_tip_info():
             view = self.view
             if not view:
@@ -347,15 +388,11 @@ class CodeintelHandler(object):
             if vid != buf.vid:
                 return
 
-            # TODO: This snippets are created and work for Python language def functions.
-            # i.e. in the form: name(arg1, arg2, arg3)
-            # Other languages might need different treatment.
-
             # Figure out how many arguments are there already:
             text_in_current_line = buf.text_in_current_line[:-1]  # Remove next char after cursor
             arguments = text_in_current_line.rpartition('(')[2].replace(' ', '').strip() or 0
+            initial_separator = ''
             if arguments:
-                initial_separator = ''
                 if arguments[-1] == ',':
                     arguments = arguments[:-1]
                 else:
@@ -364,58 +401,14 @@ class CodeintelHandler(object):
                     initial_separator += ' '
                 arguments = arguments.count(',') + 1 if arguments else 0
 
-            # Insert parameters as snippet:
-            snippet = None
-            tip_info = calltip.split('\n')
-            tip0 = tip_info[0]
-            m = re.search(r'^(.*\()([^\[\(\)]*)(.*)$', tip0)
-            if m:
-                params = [p.strip() for p in m.group(2).split(',')]
-                if params:
-                    n = 1
-                    tip0 = []
-                    snippet = []
-                    for i, p in enumerate(params):
-                        if p:
-                            var, sep, default = p.partition('=')
-                            var = var.strip()
-                            tvar = var
-                            if sep:
-                                tvar = "%s<i>=%s</i>" % (tvar, default)
-                            # if i == arguments:
-                            #     tvar = "<b>%s</b>" % tvar
-                            tip0.append(tvar)
-                            if i >= arguments:
-                                if ' ' in var:
-                                    var = var.split(' ')[1]
-                                if var[0] == '$':
-                                    var = var[1:]
-                                snippet.append('${%s:%s}' % (n, var))
-                                n += 1
-                    tip0 = "<h1>%s%s%s</h1>" % (m.group(1), ', '.join(tip0), m.group(3))
-                    snippet = ', '.join(snippet)
-                    if arguments and snippet:
-                        snippet = initial_separator + snippet
-            css = (
-                "html {background-color: #232628; color: #999999;}" +
-                "body {font-size: 10px; }" +
-                "b {color: #6699cc; }" +
-                "a {color: #99cc99; }" +
-                "h1 {color: #cccccc; font-weight: normal; font-size: 11px; }"
-            )
-
-            # Wrap lines that are too long:
-            wrapper = textwrap.TextWrapper(width=100, break_on_hyphens=False, break_long_words=False)
-            measured_tips = [tip0]
-            for t in tip_info[1:]:
-                measured_tips.extend(wrapper.wrap(t))
+            measured_tips, html, snippet = calltip_cache.render(calltip, arguments, initial_separator)
 
             if hasattr(view, 'show_popup'):
                 def insert_snippet(href):
                     view.run_command('insert_snippet', {'contents': snippet})
                     view.hide_popup()
 
-                view.show_popup('<style>%s</style>%s<br><br><a href="insert">insert</a>' % (css, "<br>".join(measured_tips)), location=-1, max_width=700, on_navigate=insert_snippet)
+                view.show_popup(html, location=-1, max_width=700, on_navigate=insert_snippet)
 
             else:
                 # Insert tooltip snippet
@@ -430,9 +423,47 @@ class CodeintelHandler(object):
                         'next_completion_if_showing': False,
                         'auto_complete_commit_on_tab': True,
                     })
-        sublime.set_timeout(_set_call_tip_info, 0)
+        sublime.set_timeout(self.traced(_set_call_tip_info, trace), 0)
+
+    def trg_pos(self, buf, trg):
+        """Return the position in the view of the trigger."""
+        pos = trg.get('pos')
+        if pos is not None:
+            pos = self.bytes2pos(buf, pos)
+        return buf.original_pos if pos is None else pos
+
+    def show_completions(self, view, buf, cplns):
+        buf.cplns = cplns or None
+        if buf.cplns:
+            view.run_command('auto_complete', {
+                'disable_auto_insert': True,
+                'api_completions_only': True,
+                'next_completion_if_showing': False,
+                'auto_complete_commit_on_tab': True,
+            })
+
+    def complete_from_cache(self, view):
+        """
+        Serve the completions by narrowing down the ones cached for the
+        current trigger, if any. Returns False if the backend is needed.
+
+        """
+        cplns = completion_cache.narrow(view, CodeintelHandler.text_mirrors.get(view.buffer_id()))
+        if cplns is None:
+            return False
+        buf = ci.buffers.get(view.id())
+        if buf is None:
+            return False
+        # Supersede any request in flight for this view:
+        trigger_scheduler.bump(view.id())
+        self.show_completions(view, buf, cplns)
+        return True
+
+    def set_auto_complete_info(self, buf, cplns, trg, trace=None):
+        version, cursor = buf.version, buf.original_pos  # what the completions were computed for
+        formatter = self.completion_formatter(buf.lang, buf.text_in_current_line, trg.get('type'))
+        stream = CompletionStream(formatter, cplns, settings.get('completion_chunk_size', 2000, lang=buf.lang))
 
-    def set_auto_complete_info(self, buf, cplns, trg):
         def _set_auto_complete_info():
             view = self.view
             if not view:
@@ -441,62 +472,236 @@ class CodeintelHandler(object):
             if vid != buf.vid:
                 return
 
-            _cplns = self.format_completions_by_language(cplns, buf.lang, buf.text_in_current_line, trg.get('type'))
-
-            buf.cplns = _cplns or None
-            if buf.cplns:
-                view.run_command('auto_complete', {
-                    'disable_auto_insert': True,
-                    'api_completions_only': True,
-                    'next_completion_if_showing': False,
-                    'auto_complete_commit_on_tab': True,
-                })
-        sublime.set_timeout(_set_auto_complete_info, 0)
+            buf.completion_stream = stream
+            pos = self.trg_pos(buf, trg)
+            line_start = view.line(pos).begin()
+            line_prefix = view.substr(sublime.Region(line_start, pos))
+            key = (vid, pos, trg.get('type'), version, cursor, line_start, line_prefix)
+            self.cache_completions(key, stream)
+            self.show_completions(view, buf, stream.rows())
+            if not stream.done:
+                run_async(lambda: self.stream_completions(view, buf, key, stream))
+
+        def _format():
+            # This handler is called in the UI thread, format (the first
+            # chunk of very large lists) out of it:
+            stream.step()
+            if trace:
+                trace.mark('format')
+            sublime.set_timeout(self.traced(_set_auto_complete_info, trace), 0)
+        run_async(_format)
+
+    def cache_completions(self, key, stream):
+        if stream.selected:
+            cplns, decorated = stream.formatted()
+            completion_cache.put(*(key + (cplns, decorated, stream.formatter)))
+
+    def stream_completions(self, view, buf, key, stream):
+        """Format the next chunk of a large completions list, out of the UI thread."""
+        if getattr(buf, 'completion_stream', None) is not stream or ci.buffers.get(buf.vid) is not buf:
+            return  # superseded
+        changed = stream.step()
+
+        def _stream_completions():
+            if getattr(buf, 'completion_stream', None) is not stream:
+                return  # superseded
+            if stream.done:
+                buf.completion_stream = None
+                self.cache_completions(key, stream)
+            else:
+                run_async(lambda: self.stream_completions(view, buf, key, stream))
+            is_auto_complete_visible = getattr(view, 'is_auto_complete_visible', None)
+            if changed and is_auto_complete_visible and is_auto_complete_visible():
+                self.show_completions(view, buf, stream.rows())
+        sublime.set_timeout(_stream_completions, 0)
 
-    def set_definitions_info(self, buf, defns, trg):
+    def set_definitions_info(self, buf, defns, trg, trace=None):
         def _set_definitions_info():
-            view = self.view
+            self.jump_to_definition(self.view, defns)
+        sublime.set_timeout(self.traced(_set_definitions_info, trace), 0)
 
-            view_sel = view.sel()
-            if not view_sel:
-                return
+    def jump_to_definition(self, view, defns):
+        if not view or not defns:
+            return
 
-            file_name = view.file_name()
-            path = file_name if file_name else "<Unsaved>"
+        view_sel = view.sel()
+        if not view_sel:
+            return
 
-            defn = defns[0]
-            row, col = defn['line'], 1
-            path = defn['path']
-            if not path:
-                msg = "Cannot jump to definition!"
-                logger.debug(msg)
-                return
+        file_name = view.file_name()
 
-            jump_location = "%s:%s:%s" % (path, row, col)
-            msg = "Jumping to: %s" % jump_location
+        defn = defns[0]
+        row, col = defn['line'], 1
+        path = defn['path']
+        if not path:
+            msg = "Cannot jump to definition!"
             logger.debug(msg)
+            return
 
-            window = sublime.active_window()
-            wid = window.id()
-            if wid not in CodeintelHandler.jump_history_by_window:
-                CodeintelHandler.jump_history_by_window[wid] = deque([], CodeintelHandler.HISTORY_SIZE)
-            jump_history = CodeintelHandler.jump_history_by_window[wid]
+        jump_location = "%s:%s:%s" % (path, row, col)
+        msg = "Jumping to: %s" % jump_location
+        logger.debug(msg)
+
+        window = sublime.active_window()
+        wid = window.id()
+        if wid not in CodeintelHandler.jump_history_by_window:
+            CodeintelHandler.jump_history_by_window[wid] = deque([], CodeintelHandler.HISTORY_SIZE)
+        jump_history = CodeintelHandler.jump_history_by_window[wid]
 
-            # Save current position so we can return to it
-            row, col = view.rowcol(view_sel[0].begin())
-            current_location = "%s:%d:%d" % (file_name, row + 1, col + 1)
-            jump_history.append(current_location)
+        # Save current position so we can return to it
+        row, col = view.rowcol(view_sel[0].begin())
+        current_location = "%s:%d:%d" % (file_name, row + 1, col + 1)
+        jump_history.append(current_location)
 
-            window.open_file(jump_location, sublime.ENCODED_POSITION)
-            window.open_file(jump_location, sublime.ENCODED_POSITION)
-        sublime.set_timeout(_set_definitions_info, 0)
+        window.open_file(jump_location, sublime.ENCODED_POSITION)
+        window.open_file(jump_location, sublime.ENCODED_POSITION)
 
     def done(self):
         pass
 
 
+class CodeintelRequest(object):
+    """
+    Handler passed to the backend for a single trigger request.
+
+    Callbacks are forwarded to the real handler only while the request is
+    still the current generation for its view; superseded requests are not
+    evaluated any further and their results are dropped. Each request has an
+    id, and the request still running in the backend for each view is kept
+    until its results arrive (or it's superseded by a newer one).
+
+    The backend isn't asked to abort superseded requests: the client assigns
+    the ids of the requests it sends later, in its sender thread, so they
+    can't be known here; the backend finishes them and the results are
+    dropped once they arrive.
+
+    """
+    ids = itertools.count(1)
+    outstanding = {}  # map of view id -> request running in the backend
+
+    def __init__(self, handler, vid, generation, trace=None):
+        self.id = next(self.ids)
+        self.handler = handler
+        self.vid = vid
+        self.generation = generation
+        self.trace = trace or tracer.trace('trigger')
+        previous = CodeintelRequest.outstanding.get(vid)
+        if previous is not None:
+            logger.debug("Request #%d superseded by #%d", previous.id, self.id)
+        CodeintelRequest.outstanding[vid] = self
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
+    @property
+    def stale(self):
+        return not trigger_scheduler.is_current(self.vid, self.generation)
+
+    def finish(self):
+        if CodeintelRequest.outstanding.get(self.vid) is self:
+            del CodeintelRequest.outstanding[self.vid]
+
+    def done(self):
+        self.finish()
+        self.handler.done()
+
+    def on_trg_from_pos(self, buf, context, trg):
+        trace = self.trace
+        trace.mark(context)
+        if self.stale:
+            self.finish()
+            trigger_scheduler.cancel()
+            trace.finish(status='cancelled')
+            return
+        cplns = completion_cache.get(self.vid, self.handler.trg_pos(buf, trg), trg.get('type'), buf.version)
+        if cplns is not None:
+            self.finish()
+            trace.kind = 'completion'
+
+            def _show_completions():
+                view = self.handler.view
+                if view and view.id() == self.vid and not self.stale:
+                    trigger_scheduler.serve()
+                    self.handler.show_completions(view, buf, cplns)
+            sublime.set_timeout(self.handler.traced(_show_completions, trace), 0)
+            return
+        buf.async_eval_at_trg(self, trg)
+
+    def _arrived(self, kind):
+        """Account for a result arriving, return False if it's stale."""
+        self.finish()
+        trace = self.trace
+        trace.kind = kind
+        trace.mark('eval')
+        if self.stale:
+            trigger_scheduler.drop()
+            trace.finish(status='stale')
+            return False
+        trigger_scheduler.serve()
+        return True
+
+    def set_call_tip_info(self, buf, calltip, explicit, trg):
+        if self._arrived('calltip'):
+            self.handler.set_call_tip_info(buf, calltip, explicit, trg, trace=self.trace)
+
+    def set_auto_complete_info(self, buf, cplns, trg):
+        if self._arrived('completion'):
+            self.handler.set_auto_complete_info(buf, cplns, trg, trace=self.trace)
+
+    def set_definitions_info(self, buf, defns, trg):
+        if self._arrived('definition'):
+            self.handler.set_definitions_info(buf, defns, trg, trace=self.trace)
+
+
+class CodeintelPrefetchRequest(object):
+    """
+    Handler passed to the backend to resolve, in advance, the definition of
+    the identifier the cursor rests on. Definitions found are stored in the
+    definition cache instead of jumping to them, and failures are silent.
+
+    """
+
+    def __init__(self, handler, key, generation):
+        self.handler = handler
+        self.key = key
+        self.vid = key[0]
+        self.generation = generation
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
+    @property
+    def stale(self):
+        return not prefetch_scheduler.is_current(self.vid, self.generation)
+
+    def on_trg_from_pos(self, buf, context, trg):
+        if self.stale:
+            prefetch_scheduler.cancel()
+            return
+        buf.async_eval_at_trg(self, trg)
+
+    def set_status_message(self, buf, message, highlight=None):
+        logger.debug("Definition prefetch: %s", message)
+
+    def set_definitions_info(self, buf, defns, trg):
+        if defns:
+            prefetch_scheduler.serve()
+            definition_cache.put(self.key, defns)
+
+
 class SublimeCodeIntel(CodeintelHandler, sublime_plugin.EventListener):
     def observer(self, topic, data):
+        # Called from the backend threads; progress of scans is merged and
+        # throttled by the aggregator, anything else is delivered right away.
+        if topic == 'codeintel_buffer_scanned':
+            notifications.scan()
+            return
+        if topic not in ('status_message', 'error_message'):
+            return
+        urgent = topic == 'error_message' or data.get('type') == 'logging' and (data.get('level') or 0) >= logging.ERROR
+        notifications.receive(topic, data, self.notify, urgent)
+
+    def notify(self, topic, data):
         def _get_and_log_message(response):
             message = response.get('message')
             if message:
@@ -505,52 +710,46 @@ class SublimeCodeIntel(CodeintelHandler, sublime_plugin.EventListener):
                     logger.error(message.rstrip() + "\n" + stack)
             return message
 
-        def _observer():
-            if topic == 'status_message':
-                ltype = 'info'
-            elif topic == 'error_message':
+        if topic == 'status_message':
+            ltype = 'info'
+        else:
+            ltype = 'error'
+        logger_obj = None
+        if data.get('type') == 'logging':
+            # logger_name = data.get('name')
+            level = data.get('level')
+            if level >= logging.CRITICAL:
+                logger_obj = logger.critical
+                ltype = 'critical'
+            elif level >= logging.ERROR:
+                logger_obj = logger.error
                 ltype = 'error'
-            elif 'codeintel_buffer_scanned':
-                return
+            elif level >= logging.WARNING:
+                logger_obj = logger.warn
+                ltype = 'warning'
+            elif level >= logging.INFO:
+                logger_obj = logger.info
+                ltype = 'info'
+            elif level >= logging.DEBUG:
+                logger_obj = logger.debug
+                ltype = 'debug'
+        progress = data.get('progress') or data.get('completed')
+        if progress is not None:
+            total = data.get('total', 100)
+            if not total:
+                progress = None
+            elif total == 100:
+                progress = ("%0.1f" % progress).rstrip('.0') + "%"
             else:
-                return
-            logger_obj = None
-            if data.get('type') == 'logging':
-                # logger_name = data.get('name')
-                level = data.get('level')
-                if level >= logging.CRITICAL:
-                    logger_obj = logger.critical
-                    ltype = 'critical'
-                elif level >= logging.ERROR:
-                    logger_obj = logger.error
-                    ltype = 'error'
-                elif level >= logging.WARNING:
-                    logger_obj = logger.warn
-                    ltype = 'warning'
-                elif level >= logging.INFO:
-                    logger_obj = logger.info
-                    ltype = 'info'
-                elif level >= logging.DEBUG:
-                    logger_obj = logger.debug
-                    ltype = 'debug'
-            progress = data.get('progress') or data.get('completed')
-            if progress is not None:
-                total = data.get('total', 100)
-                if not total:
-                    progress = None
-                elif total == 100:
-                    progress = ("%0.1f" % progress).rstrip('.0') + "%"
-                else:
-                    progress = "%s/%s" % (progress, total)
-            message = _get_and_log_message(data)
-            if progress and message:
-                message = "%s - %s" % (progress, message)
-            elif progress:
-                message = progress
-            elif not message:
-                return
-            self.set_status(ltype, message, lid='SublimeCodeIntel Notification', logger_obj=logger_obj)
-        sublime.set_timeout(_observer, 0)
+                progress = "%s/%s" % (progress, total)
+        message = _get_and_log_message(data)
+        if progress and message:
+            message = "%s - %s" % (progress, message)
+        elif progress:
+            message = progress
+        elif not message:
+            return
+        self.set_status(ltype, message, lid='SublimeCodeIntel Notification', logger_obj=logger_obj)
 
     def on_pre_save(self, view):
         if view.is_dirty():
@@ -561,6 +760,45 @@ class SublimeCodeIntel(CodeintelHandler, sublime_plugin.EventListener):
     def on_close(self, view):
         vid = view.id()
         ci.buffers.pop(vid, None)
+        CodeintelRequest.outstanding.pop(vid, None)
+        buffer_registry.forget(vid)
+        CodeintelHandler.text_mirrors.pop(view.buffer_id(), None)
+        identifier_index.forget(view.buffer_id())
+        CodeintelHandler.text_windows.pop(view.buffer_id(), None)
+        trigger_scheduler.forget(vid)
+        prefetch_scheduler.forget(vid)
+        completion_cache.forget(vid)
+
+    def typed(self, view):
+        """
+        Whether the last modification of the view was typing (or inserting)
+        text that might trigger. The command history is only looked up as
+        far back as needed.
+
+        """
+        command_history = getattr(view, 'command_history', None)
+        if not command_history:
+            return True
+
+        redo_command = command_history(1)
+        if redo_command[1] is not None:
+            return False
+
+        previous_command = command_history(0)
+        name, args = previous_command[0], previous_command[1]
+        if name == 'insert':
+            return args['characters'][-1] not in ('\n', '\t')
+        if name in ('insert_completion', 'paste', 'codeintel_complete_commit'):
+            return True
+        if name == 'insert_snippet':
+            return args['contents'] in (
+                '(${0:$SELECTION})', '[${0:$SELECTION}]', '{${0:$SELECTION}}', '`${0:$SELECTION}`', '"${0:$SELECTION}"', "'${0:$SELECTION}'",
+                '($0)', '[$0]', '{$0}', '`$0`', '"$0"', "'$0'",
+            )
+        if name in ('commit_completion', 'insert_best_completion'):
+            before_previous_command = command_history(-1)
+            return before_previous_command[0] in ('insert', 'paste')
+        return False
 
     def on_modified(self, view):
         view_sel = view.sel()
@@ -577,41 +815,77 @@ class SublimeCodeIntel(CodeintelHandler, sublime_plugin.EventListener):
         if not current_char or current_char in ('\n', '\t'):
             return
 
-        command_history = getattr(view, 'command_history', None)
-        if command_history:
-            redo_command = command_history(1)
-            previous_command = view.command_history(0)
-            before_previous_command = view.command_history(-1)
-        else:
-            redo_command = previous_command = before_previous_command = None
+        if not self.typed(view):
+            return
 
-        # print('on_modified', "%r\n\tcommand_history: %r\n\tredo_command: %r\n\tprevious_command: %r\n\tbefore_previous_command: %r" % (current_char, bool(command_history), redo_command, previous_command, before_previous_command))
-        if not command_history or redo_command[1] is None and (
-            previous_command[0] == 'insert' and previous_command[1]['characters'][-1] not in ('\n', '\t') or
-            previous_command[0] in ('insert_completion', 'paste', 'codeintel_complete_commit') or
-            previous_command[0] == 'insert_snippet' and previous_command[1]['contents'] in (
-                '(${0:$SELECTION})', '[${0:$SELECTION}]', '{${0:$SELECTION}}', '`${0:$SELECTION}`', '"${0:$SELECTION}"', "'${0:$SELECTION}'",
-                '($0)', '[$0]', '{$0}', '`$0`', '"$0"', "'$0'",
-            ) or
-            before_previous_command[0] in ('insert', 'paste') and (
-                previous_command[0] == 'commit_completion' or
-                previous_command[0] == 'insert_completion' or
-                previous_command[0] == 'insert_best_completion'
-            )
-        ):
+        trace = tracer.trace('trigger')
+        if self.complete_from_cache(view):
+            trace.kind = 'completion'
+            trace.lang = getattr(ci.buffers.get(view.id()), 'lang', None)
+            trace.finish('cache')
+            return
+
+        lang = self.guess_language(view, view.file_name())
+        if not lang:
+            return
+        if settings.get('live_prefilter', True, lang=lang):
+            text = view.substr(sublime.Region(max(0, pos - trigger_filter.LOOKBEHIND), pos))
+            if not trigger_filter.can_trigger(lang, text, ci.languages):
+                return
+
+        vid = view.id()
+        indexer.interact()
+
+        def _trigger(generation):
+            trace.mark('coalesce')
             buf = self.buf_from_view(view)
+            trace.mark('buf_from_view')
             # print('on_modified.triggering', bool(buf))
             if buf:
-                buf.trg_from_pos(self, True)
+                trace.lang = buf.lang
+                buf.trg_from_pos(CodeintelRequest(self, vid, generation, trace), True)
+        trigger_scheduler.schedule(vid, _trigger, settings.get('live_delay', 0))
 
     def on_selection_modified(self, view):
-        pass
+        if settings.get('@disable', False) or not settings.get('definition_prefetch', False):
+            return
+
+        key = definition_cache.key(view)
+        if key is None or key in definition_cache:
+            return
+
+        def _prefetch(generation):
+            if definition_cache.key(view) != key:
+                return  # moved away or modified in the meantime
+            buf = self.buf_from_view(view)
+            if buf:
+                buf.defn_trg_from_pos(CodeintelPrefetchRequest(self, key, generation))
+        prefetch_scheduler.schedule(key[0], _prefetch, settings.get('definition_prefetch_delay', 500))
+
+    def on_activated(self, view):
+        index_window(view.window())
 
     def on_query_completions(self, view, prefix, locations):
+        indexer.interact()
         buf = self.buf_from_view(view)
+        cplns = None
         if buf:
             cplns, buf.cplns = getattr(buf, 'cplns', None), None
-            return cplns
+            if cplns is None:
+                cplns = completion_cache.narrow(view, buf.mirror)
+        if cplns is None and (not startup.ready or not buf or view.id() in CodeintelRequest.outstanding):
+            # CodeIntel is starting or still working on it, use the
+            # identifiers in the buffers meanwhile:
+            cplns = self.identifier_completions(view, buf, prefix)
+        return cplns
+
+    def on_load_project(self, window):
+        settings.invalidate_prefs()
+        indexer.forget()
+        index_window(window)
+
+    def on_post_save_project(self, window):
+        settings.invalidate_prefs()
 
     def on_query_context(self, view, key, operator, operand, match_all):
         if key.startswith("codeintel.setting."):
@@ -623,24 +897,57 @@ class SublimeCodeIntel(CodeintelHandler, sublime_plugin.EventListener):
                 return value == operand
 
 
+if hasattr(sublime_plugin, 'TextChangeListener'):
+    class CodeintelTextChangeListener(sublime_plugin.TextChangeListener):
+        def on_text_changed(self, changes):
+            mirror = CodeintelHandler.text_mirrors.get(self.buffer.id())
+            if mirror is None or not changes:
+                return
+            view = self.buffer.primary_view()
+            if not view:
+                return
+            # Changes come in order, each batch on top of the previous one, so
+            # they apply to the mirrored version (checked with the view size):
+            mirror.apply([(c.a.pt, c.b.pt, c.str) for c in changes], view.change_count(), view.size())
+
+
 class CodeintelAutoCompleteCommand(CodeintelHandler, sublime_plugin.TextCommand):
     def run(self, edit, block=False):
         view = self.view
 
+        indexer.interact()
+        trace = tracer.trace('trigger')
         buf = self.buf_from_view(view)
+        trace.mark('buf_from_view')
 
         if buf:
-            buf.trg_from_pos(self, True)
+            trace.lang = buf.lang
+            vid = view.id()
+            generation = trigger_scheduler.bump(vid)
+            buf.trg_from_pos(CodeintelRequest(self, vid, generation, trace), True)
 
 
 class CodeintelGoToDefinitionCommand(CodeintelHandler, sublime_plugin.TextCommand):
     def run(self, edit, block=False):
         view = self.view
 
+        indexer.interact()
+        trace = tracer.trace('definition')
+        key = definition_cache.key(view)
+        defns = definition_cache.get(key) if key else None
+        if defns:
+            self.jump_to_definition(view, defns)
+            trace.finish('cache')
+            return
+
         buf = self.buf_from_view(view)
+        trace.mark('buf_from_view')
 
         if buf:
-            buf.defn_trg_from_pos(self)
+            trace.lang = buf.lang
+            vid = view.id()
+            generation = trigger_scheduler.bump(vid)
+            buf.defn_trg_from_pos(CodeintelRequest(self, vid, generation, trace))
 
 
 class CodeintelBackFromDefinitionCommand(sublime_plugin.TextCommand):
@@ -661,7 +968,7 @@ class CodeintelCompleteCommitCommand(CodeintelHandler, sublime_plugin.TextComman
         view = self.view
 
         buf = self.buf_from_view(view)
-        if buf:
+        if buf and buf.lang in buf.service.languages:
             cpln_fillup_chars = buf.cpln_fillup_chars
             cpln_stop_chars = buf.cpln_stop_chars
         else:
@@ -683,41 +990,82 @@ class CodeintelCompleteCommitCommand(CodeintelHandler, sublime_plugin.TextComman
             view.run_command('insert', {'characters': character})
 
 
+class CodeintelStatsCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        stats = [
+            ('Startup', startup.stats()),
+            ('Triggers', trigger_scheduler.stats()),
+            ('Trigger filter', trigger_filter.stats()),
+            ('Completion cache', completion_cache.stats()),
+            ('Completion streams', CompletionStream.stats()),
+            ('Identifiers', identifier_index.stats()),
+            ('Calltip cache', calltip_cache.stats()),
+            ('Definition prefetch', prefetch_scheduler.stats()),
+            ('Definition cache', definition_cache.stats()),
+            ('Status bar', status_queue.stats()),
+            ('Notifications', notifications.stats()),
+            ('Buffers', buffer_registry.stats()),
+            ('Indexer', indexer.stats()),
+            ('Watcher', watcher.stats()),
+            ('Pool', pool.stats()),
+        ]
+        lines = []
+        for section, values in stats:
+            lines.append("%s:" % section)
+            for k, v in sorted(values.items()):
+                lines.append("    %s: %s" % (k, v))
+        panel = self.window.create_output_panel('codeintel')
+        panel.run_command('append', {'characters': "\n".join(lines) + "\n"})
+        self.window.run_command('show_panel', {'panel': 'output.codeintel'})
+
+
+class CodeintelLatencyCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        lines = ["%-12s %-12s %-16s %6s %10s %10s %10s" % ('request', 'language', 'stage', 'count', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)')]
+        for kind, lang, stage, count, p50, p95, p99 in sorted(tracer.stats(), key=lambda s: (s[0], s[1] or '')):
+            lines.append("%-12s %-12s %-16s %6d %10.2f %10.2f %10.2f" % (kind, lang, stage, count, p50, p95, p99))
+        counts = tracer.counts()
+        lines.append("")
+        lines.append("Recent requests: " + ", ".join("%s: %s" % (k, v) for k, v in sorted(counts.items())))
+        panel = self.window.create_output_panel('codeintel')
+        panel.run_command('append', {'characters': "\n".join(lines) + "\n"})
+        self.window.run_command('show_panel', {'panel': 'output.codeintel'})
+
+
 ################################################################################
 # Initialize settings and main objects only once
 
 class CodeintelSettings(Settings):
     nested_settings = ('syntax_map', 'language_settings')
+    languages_key = 'language_settings'
+
+    def __init__(self, name):
+        super(CodeintelSettings, self).__init__(name)
+        self.prefs_cache = {}  # map of (lang, folders, version) -> prefs
+        self.matchers = {}  # map of (lang, version) -> PathMatcher
+
+    def invalidate_prefs(self):
+        """Forget the compiled prefs (e.g. when the project changes)."""
+        self.prefs_cache.clear()
+        self.matchers.clear()
 
     def get(self, setting, default=None, lang=None):
-        """Return a plugin setting, defaulting to default if not found."""
-        language_settings = self.settings.get('language_settings', {}).get(lang)
-        if language_settings and setting in language_settings:
-            return language_settings[setting]
-        return super(CodeintelSettings, self).get(setting, default)
+        """Return a plugin setting (for the language), defaulting to default if not found."""
+        return self.snapshot.get(setting, default, lang)
 
     def on_update(self):
         """
-        The previous settings are compared with the new settings; depending
-        on what changed, engine will either be reconfigured or restarted.
+        Depending on what changed since the previous settings, engine will
+        either be reconfigured or restarted.
 
         """
-        need_deactivate = False
-
-        for setting in ('@disable', 'command', 'oop_mode', 'log_levels'):
-            if (
-                setting in self.changeset or
-                self.previous_settings and self.previous_settings.get(setting) != self.settings.get(setting)
-            ):
-                self.changeset.discard(setting)
-                need_deactivate = True
-
-        if (
-            'debug' in self.changeset or
-            self.previous_settings.get('debug', False) != self.settings.get('debug', False)
-        ):
-            self.changeset.discard('debug')
+        self.invalidate_prefs()
+
+        # On first load there's nothing to restart (unless explicitly changed):
+        restart = set(('@disable', 'command', 'oop_mode', 'log_levels'))
+        need_deactivate = bool(restart & self.changeset or self.previous_settings and restart & self.changed)
 
+        if 'debug' in self.changed:
             if self.settings.get('debug'):
                 logger.setLevel(logging.DEBUG)
                 codeintel_logger.setLevel(logging.DEBUG)
@@ -725,24 +1073,80 @@ class CodeintelSettings(Settings):
                 logger.setLevel(logger_level)
                 codeintel_logger.setLevel(codeintel_logger_level)
 
-        if need_deactivate:
-            ci.deactivate()
-
-        if not self.settings.get('@disable'):
-            env = dict(os.environ)
-            env.update(self.settings.get('env', {}))
-
-            prefs = self.get_prefs()
+        CodeintelHandler.completion_formatters.clear()
+
+        trace_file = self.settings.get('trace_file')
+        tracer.configure(
+            size=self.settings.get('trace_size', 1000),
+            path=os.path.expanduser(trace_file) if trace_file else None,
+            enabled=self.settings.get('trace', True),
+        )
+
+        exclude = self.get_exclude_matcher()
+        indexer.configure(
+            enabled=self.settings.get('index_project', True) and not self.settings.get('@disable'),
+            exclude=exclude,
+            max_depth=self.settings.get('max_recursive_dir_depth', 10),
+            database=database_key(self.settings.get('command')),
+        )
+        watcher.configure(
+            mode=self.settings.get('watch_mode', 'auto'),
+            poll_interval=self.settings.get('watch_poll_interval', 60),
+            exclude=exclude,
+        )
+
+        buffer_registry.resize(self.settings.get('buffers_memory', 128 * 1024 * 1024))
+
+        notifications.configure(rate=self.settings.get('notification_rate', 4))
+
+        completion_cache.cache.resize(
+            max_size=self.settings.get('completion_cache_size', 32),
+            max_weight=self.settings.get('completion_cache_memory', 8 * 1024 * 1024),
+        )
+
+        if self.settings.get('@disable'):
+            pool.shutdown()
+            if need_deactivate:
+                startup.state = startup.INACTIVE
+                startup.run(ci.deactivate)
+            return
 
-            if ci.enabled:
-                ci.mgr.set_global_environment(
-                    env=env,
-                    prefs=prefs,
-                )
-            else:
-                command = self.settings.get('command')
-                oop_mode = self.settings.get('oop_mode')
-                log_levels = self.settings.get('log_levels')
+        env = dict(os.environ)
+        env.update(self.settings.get('env', {}))
+
+        prefs = self.get_prefs()
+
+        pool.configure(
+            enabled=self.settings.get('pool_mode', False),
+            size=self.settings.get('pool_size', 2),
+            idle_timeout=self.settings.get('pool_idle_timeout', 600),
+            groups=self.settings.get('pool_groups', []),
+            activation={
+                'codeintel_command': self.settings.get('command'),
+                'oop_mode': self.settings.get('oop_mode'),
+                'log_levels': self.settings.get('log_levels'),
+                'env': env,
+            },
+            prefs_for=self.get_group_prefs,
+        )
+
+        if ci.enabled and not need_deactivate:
+            ci.mgr.set_global_environment(
+                env=env,
+                prefs=prefs,
+            )
+            if startup.state == startup.INACTIVE:
+                # The plugin was reloaded with the backend already running:
+                startup.activate(lambda: None, backend_state, prewarm)
+        else:
+            command = self.settings.get('command')
+            oop_mode = self.settings.get('oop_mode')
+            log_levels = self.settings.get('log_levels')
+
+            def _activate():
+                # Spawning the backend can take a while, never do it in the UI thread:
+                if need_deactivate:
+                    ci.deactivate()
                 ci.activate(
                     reset_db_as_necessary=False,
                     codeintel_command=command,
@@ -751,8 +1155,82 @@ class CodeintelSettings(Settings):
                     env=env,
                     prefs=prefs,
                 )
+            startup.activate(_activate, backend_state, prewarm)
+
+    def get_group_prefs(self, langs):
+        """Return the prefs for a group of languages (for a pool worker)."""
+        prefs = {}
+        for lang in langs:
+            prefs.update(self.get_prefs(lang))
+        return prefs
+
+    def get_project_prefs(self, lang, folders):
+        """
+        Return the prefs for the language with the project folders added to
+        its extra paths. The compiled prefs are cached per folder set and
+        settings version; they should not be modified.
+
+        """
+        key = (lang, tuple(folders), self.version)
+        try:
+            return self.prefs_cache[key]
+        except KeyError:
+            pass
+
+        prefs = dict(self.get_prefs(lang))
+        extra_paths_name = EXTRA_PATHS_MAP.get(lang)
+        extra_paths = prefs.get(extra_paths_name, '').split(os.pathsep)
+        exclude = self.get_exclude_matcher(lang)
+        for f in folders:
+            f = os.path.normcase(os.path.normpath(os.path.expanduser(f))).rstrip(os.sep)
+            if f not in extra_paths and not exclude.excluded(f):
+                extra_paths.append(f)
+        if extra_paths:
+            prefs[extra_paths_name] = os.pathsep.join(extra_paths)
+
+        self.prefs_cache[key] = prefs
+        return prefs
+
+    def get_exclude_matcher(self, lang=None):
+        """
+        Return the PathMatcher for the paths excluded from the scans of the
+        language (or of all languages if lang is None): scan_exclude_paths
+        and the language's scan_exclude_paths and *ExcludePaths settings.
+        Matchers are cached per settings version.
+
+        """
+        key = (lang, self.version)
+        try:
+            return self.matchers[key]
+        except KeyError:
+            pass
+
+        patterns = list(self.settings.get('scan_exclude_paths', []))
+        disabled_languages = self.settings.get('disabled_languages', [])
+        for language, language_settings in self.settings.get('language_settings', {}).items():
+            if lang is not None and language != lang:
+                continue
+            if language in disabled_languages or language_settings.get('@disable'):
+                continue
+            patterns.extend(language_settings.get('scan_exclude_paths', []))
+            patterns.extend(language_settings.get(EXCLUDE_PATHS_MAP.get(language), []))
+
+        matcher = self.matchers[key] = PathMatcher(unique(patterns))
+        return matcher
 
     def get_prefs(self, lang=None):
+        """
+        Return the prefs for the language (or for all languages if lang is
+        None). The compiled prefs are cached per settings version; they
+        should not be modified.
+
+        """
+        key = (lang, None, self.version)
+        try:
+            return self.prefs_cache[key]
+        except KeyError:
+            pass
+
         prefs = {
             'codeintel_max_recursive_dir_depth': self.settings.get('max_recursive_dir_depth'),
             'codeintel_scan_files_in_project': self.settings.get('scan_files_in_project'),
@@ -797,6 +1275,7 @@ class CodeintelSettings(Settings):
             if exclude_paths_name:
                 prefs[exclude_paths_name] = os.pathsep.join(unique(scan_exclude_paths + language_scan_exclude_paths))
 
+        self.prefs_cache[key] = prefs
         return prefs
 
 
@@ -807,14 +1286,145 @@ class CodeintelToggleSettingCommand(SettingTogglerCommandMixin, sublime_plugin.W
     settings = settings
 
 
+def when_serving(lang, fn, timeout=Indexer.SCAN_TIMEOUT):
+    """
+    Call fn(service) in the UI thread with the CodeIntel backend serving the
+    language, once there's one (its pool worker might be starting).
+
+    """
+    deadline = time.time() + timeout
+
+    def _when_serving():
+        service = pool.service(lang)
+        if service is not None:
+            fn(service)
+        elif time.time() < deadline:
+            sublime.set_timeout(_when_serving, 500)
+    sublime.set_timeout(_when_serving, 0)
+
+
+def index_file(path, lang, text, handler):
+    """Have CodeIntel scan a file from disk (called by the indexer)."""
+    def _index_file(service):
+        # CodeIntel keeps the content it last got for a path, always send it:
+        buf = CodeIntelBuffer(service, vid=None, lang=lang, path=path, text=text)
+        buf.prefs = settings.get_prefs(lang)
+        buf.scan_document(handler, False, file_mtime=True)
+    when_serving(lang, _index_file)
+
+
+def purge_file(path, lang, handler):
+    """Have CodeIntel forget a deleted file (called by the indexer)."""
+    def _purge_file(service):
+        # Scanning it as an empty document leaves nothing of it in the
+        # database (if the file comes back, it's scanned with its content):
+        buf = CodeIntelBuffer(service, vid=None, lang=lang, path=path, text='')
+        buf.prefs = settings.get_prefs(lang)
+        buf.scan_document(handler, False)
+    when_serving(lang, _purge_file)
+
+
+def index_window(window):
+    """Start indexing the folders (and extra paths) of the window in background."""
+    if not window or not ci.languages:
+        return
+    disabled_languages = settings.get('disabled_languages', [])
+    indexer.configure(languages=[l for l in ci.languages if l not in disabled_languages and not settings.get('@disable', False, lang=l)])
+    roots = [os.path.normcase(os.path.normpath(os.path.expanduser(f))).rstrip(os.sep) for f in window.folders()]
+    prefs = settings.get_prefs()
+    for extra_paths_name in set(EXTRA_PATHS_MAP.values()):
+        roots.extend(prefs.get(extra_paths_name, '').split(os.pathsep))
+    indexer.index(unique(roots), [v.file_name() for v in window.views() if v.file_name()])
+
+
+def database_key(command):
+    """
+    Identify the CodeIntel database files get indexed into: the command
+    running CodeIntel and when its database was created (it's created anew
+    when reset), so the manifest of indexed files is only used with it.
+
+    """
+    try:
+        created = os.stat(DATABASE_VERSION).st_mtime
+    except OSError:
+        created = None
+    return "%s:%s" % (command or 'codeintel', created)
+
+
+def backend_state(service=None):
+    """Return the startup state of a CodeIntel manager (None while starting)."""
+    mgr = (service or ci).mgr
+    state = getattr(mgr, 'state', None)
+    if state is CodeIntelManager.STATE_READY:
+        return Startup.READY
+    if mgr is None or state in (CodeIntelManager.STATE_BROKEN, CodeIntelManager.STATE_DESTROYED):
+        return Startup.FAILED
+
+
+def prewarm():
+    """
+    Warm CodeIntel up for the open views: scan the active view of each
+    language (which loads the language and its catalogs in the backend)
+    and start indexing the windows.
+
+    """
+    trigger_filter.forget()  # rebuilt with the language info of the backend
+    indexer.configure(database=database_key(settings.get('command')))  # the backend might have reset it
+    handler = CodeintelHandler()
+    langs = set()
+    for window in sublime.windows():
+        views = [window.active_view()] + window.views()
+        for view in views:
+            if not view or not view.file_name():
+                continue
+            lang = handler.guess_language(view, view.file_name())
+            if lang in langs:
+                continue
+            buf = handler.buf_from_view(view)
+            if buf:
+                langs.add(lang)
+                buf.scan_document(handler, False)
+        index_window(window)
+    startup.prewarmed = sorted(langs)
+
+
 if 'ci' not in globals():
     ci = CodeIntel(lambda fn: sublime.set_timeout(fn, 0))
 
+pool = CodeIntelPool(ci, lambda: CodeIntel(lambda fn: sublime.set_timeout(fn, 0)), lambda worker: backend_state(worker) == Startup.READY)
+trigger_scheduler = TriggerScheduler()
+trigger_filter = TriggerFilter()
+completion_cache = CompletionCache()
+identifier_index = IdentifierIndex()
+calltip_cache = CalltipCache()
+prefetch_scheduler = TriggerScheduler()
+definition_cache = DefinitionCache()
+tracer = Tracer()
+status_queue = StatusQueue()
+startup = Startup()
+notifications = NotificationAggregator()
+buffer_registry = BufferRegistry(release=CodeintelHandler.release_buffer)
+watcher = Watcher(lambda paths, deleted: indexer.rescan(paths, deleted))
+indexer = Indexer(index_file, watcher.watch, purge_file)
+
 
 ################################################################################
 
 def plugin_loaded():
-    settings.load()
+    if hasattr(sublime, 'cache_path'):
+        manifest = os.path.join(sublime.cache_path(), NAME, 'manifest.json')
+    else:
+        manifest = os.path.expanduser(os.path.join('~', '.codeintel', 'sublime-manifest.json'))
+    indexer.configure(manifest=manifest)
+    startup.mark('plugin_loaded')
+    startup.block(settings.load)
+
+
+def plugin_unloaded():
+    pool.shutdown()
+    watcher.stop()
+    indexer.stop()
+    identifier_index.stop()
 
 
 # ST3 features a plugin_loaded hook which is called when ST's API is ready.
@@ -0,0 +1,143 @@
+"""
+Fake CodeIntel client used by the benchmarks in place of libs/codeintel.py.
+
+It implements the parts of the client API the plugin uses and answers
+every request immediately, in the calling thread, with canned results.
+Requests go through the manager like in the real client; when the manager
+is `deferred` they are kept pending until respond() is called.
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+import logging
+
+logger = logging.getLogger('CodeIntel.fake')
+logger_level = logging.WARNING
+
+LANGUAGES = ['Python', 'Python3', 'PHP', 'ECMAScript', 'JavaScript', 'Ruby', 'Perl', 'C++']
+
+
+class CodeIntelManager(object):
+    STATE_UNINITIALIZED = ("uninitialized",)
+    STATE_BROKEN = ("broken",)
+    STATE_READY = ("ready",)
+    STATE_DESTROYED = ("destroyed",)
+
+    def __init__(self):
+        self.state = CodeIntelManager.STATE_READY
+        self.requests = {}  # map of req_id -> (callback, request, sent time)
+        self.documents = {}  # map of path -> text of the buffers known
+        self.scanned = {}  # map of path -> text last scanned
+        self.next_id = 0
+        self.deferred = False
+        self.env = None
+        self.prefs = None
+
+    def set_global_environment(self, env, prefs):
+        self.env = env
+        self.prefs = prefs
+
+    def send(self, callback=None, **kwargs):
+        if kwargs.get('command') == 'scan-document':
+            self.scan(kwargs.get('path'), kwargs.get('text'))
+        self.next_id += 1
+        req_id = hex(self.next_id)
+        kwargs['req_id'] = req_id
+        self.requests[req_id] = (callback, kwargs, time.time())
+        if not self.deferred:
+            self.respond(req_id)
+
+    def scan(self, path, text):
+        """Scan a document like the driver does: buffers are kept by path
+        and only get a new content when it's given."""
+        if text is not None:
+            self.documents[path] = text
+        elif path not in self.documents:
+            try:
+                with open(path, 'rb') as f:
+                    self.documents[path] = f.read().decode('utf-8', 'replace')
+            except (IOError, OSError):
+                self.documents[path] = ''
+        self.scanned[path] = self.documents[path]
+
+    def respond(self, req_id=None):
+        """Answer a pending request (or all of them)."""
+        for req_id in [req_id] if req_id else list(self.requests):
+            callback, request, sent_time = self.requests.pop(req_id)
+            if callback:
+                callback(request, {})
+
+
+class CodeIntel(object):
+    def __init__(self, dispatcher=None):
+        self.dispatcher = dispatcher
+        self.buffers = {}
+        self.languages = dict((l, {}) for l in LANGUAGES)
+        self.enabled = False
+        self.mgr = None
+        self.observers = []
+        # Canned results:
+        self.completions = []
+        self.calltip = "function(a, b=None)\nDocumentation."
+        self.definitions = [{'path': '/tmp/fake.py', 'line': 1}]
+
+    def add_observer(self, obj):
+        self.observers.append(obj)
+
+    def activate(self, reset_db_as_necessary=False, codeintel_command=None, oop_mode=None, log_levels=None, env=None, prefs=None):
+        self.mgr = CodeIntelManager()
+        self.mgr.set_global_environment(env, prefs)
+        self.enabled = True
+
+    def deactivate(self):
+        self.mgr = None
+        self.enabled = False
+
+    def send(self, callback=None, **kwargs):
+        if self.mgr:
+            self.mgr.send(callback=callback, **kwargs)
+        elif callback:
+            callback(kwargs, {})
+
+
+class CodeIntelBuffer(object):
+    cpln_fillup_chars = "~`!@#$%^&()-=+{}[]|\\;:'\",.<>?/ "
+    cpln_stop_chars = "~`!@#$%^&*()-=+{}[]|\\;:'\",.<>?/ "
+
+    def __init__(self, service, vid, lang=None, path=None, text=None, env=None, prefs=None):
+        self.service = service
+        self.vid = vid
+        self.lang = lang
+        self.path = path
+        self.text = text
+        self.env = env
+        self.prefs = prefs
+        self.pos = 0
+
+    def scan_document(self, handler, lines_added, file_mtime=False, callback=None):
+        def _callback(request, response):
+            handler.on_document_scanned(self)
+        self.service.send(command='scan-document', path=self.path, text=self.text, callback=_callback)
+
+    def trg_from_pos(self, handler, implicit, pos=None):
+        trg = {'type': 'object-members', 'form': 0, 'pos': self.pos if pos is None else pos}
+
+        def _callback(request, response):
+            handler.on_trg_from_pos(self, 'trg_from_pos', trg)
+        self.service.send(command='trg-from-pos', pos=trg['pos'], callback=_callback)
+
+    def defn_trg_from_pos(self, handler, pos=None):
+        trg = {'type': 'defn', 'form': 2, 'pos': self.pos if pos is None else pos}
+
+        def _callback(request, response):
+            handler.on_trg_from_pos(self, 'defn_trg_from_pos', trg)
+        self.service.send(command='trg-from-pos', pos=trg['pos'], callback=_callback)
+
+    def async_eval_at_trg(self, handler, trg):
+        def _callback(request, response):
+            if trg['type'] == 'defn':
+                handler.set_definitions_info(self, self.service.definitions, trg)
+            else:
+                handler.set_auto_complete_info(self, self.service.completions, trg)
+        self.service.send(command='eval', trg=trg, callback=_callback)
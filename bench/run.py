@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+"""
+Headless micro-benchmarks for the SublimeCodeIntel plugin hot paths.
+
+The plugin is imported using stub `sublime`/`sublime_plugin` modules
+(bench/stubs) and a fake CodeIntel client (bench/fake_codeintel.py), so
+no Sublime Text nor CodeIntel installation is needed. Results are written
+as JSON so different releases can be compared:
+
+    python bench/run.py -o before.json
+    python bench/run.py -o after.json --compare before.json
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import gc
+import json
+import time
+import types
+import random
+import platform
+import argparse
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_PATH = os.path.dirname(BENCH_PATH)
+PACKAGE = 'SublimeCodeIntel'
+
+BENCH_SETTINGS = {
+    'index_project': False,
+    'watch_mode': 'off',
+}
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def load_plugin():
+    """Import the plugin as the SublimeCodeIntel package, using the stubs."""
+    sys.path.insert(0, os.path.join(BENCH_PATH, 'stubs'))
+    sys.path.insert(0, BENCH_PATH)
+
+    import fake_codeintel
+
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [PACKAGE_PATH]
+    sys.modules[PACKAGE] = package
+    libs = types.ModuleType(PACKAGE + '.libs')
+    libs.__path__ = [os.path.join(PACKAGE_PATH, 'libs')]
+    sys.modules[PACKAGE + '.libs'] = libs
+    sys.modules[PACKAGE + '.libs.codeintel'] = fake_codeintel
+
+    # Nothing should walk or watch the disk while timing:
+    import sublime
+    sublime.load_settings(PACKAGE + '.sublime-settings').set('user', BENCH_SETTINGS)
+
+    __import__(PACKAGE + '.SublimeCodeIntel')
+    plugin = sys.modules[PACKAGE + '.SublimeCodeIntel']
+    plugin.plugin_loaded()
+
+    # The backend is activated in background, wait for it:
+    deadline = time.time() + 10
+    while plugin.ci.mgr is None and time.time() < deadline:
+        time.sleep(0.01)
+    sublime.run_timeouts()
+    return plugin
+
+
+def measure(fn, repeat, number=1, setup=None):
+    """Return timings, in milliseconds per call, of `repeat` runs of fn."""
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = timer()
+            for _ in range(number):
+                fn()
+            timings.append((timer() - start) * 1000.0 / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return timings
+
+
+def summarize(name, params, timings):
+    timings = sorted(timings)
+    n = len(timings)
+    return {
+        'name': name,
+        'params': params,
+        'runs': n,
+        'min_ms': timings[0],
+        'median_ms': timings[n // 2],
+        'mean_ms': sum(timings) / n,
+        'max_ms': timings[-1],
+    }
+
+
+def make_source(size, non_ascii=False):
+    """Return about `size` characters of Python looking source code."""
+    rnd = random.Random(size)
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        if i % 20 == 0:
+            line = "def function_%d(arg1, arg2=None):" % i
+        elif non_ascii and i % 7 == 0:
+            line = "    value_%d = 'ñandú €%d'" % (i, rnd.randint(0, 1000))
+        else:
+            line = "    value_%d = obj.attribute_%d + %d" % (i, rnd.randint(0, 1000), i)
+        lines.append(line)
+        total += len(line) + 1
+        i += 1
+    return "\n".join(lines)[:size]
+
+
+def make_completions(count):
+    kinds = ['function', 'variable', 'class', 'attribute', 'import']
+    rnd = random.Random(count)
+    return [(rnd.choice(kinds), 'member_%05d' % i, 'member_%05d(self, arg)' % i) for i in range(count)]
+
+
+class HistoricPosition(object):
+    """Like sublime.HistoricPosition: a position as of the change made."""
+    def __init__(self, text, pt):
+        line_start = text.rfind('\n', 0, pt) + 1
+        self.pt = pt
+        self.row = text.count('\n', 0, pt)
+        self.col = pt - line_start
+        self.col_utf16 = len(text[line_start:pt].encode('utf-16-le')) // 2
+        self.col_utf8 = len(text[line_start:pt].encode('utf-8'))
+
+
+class TextChange(object):
+    """Like sublime.TextChange, for the text before the change."""
+    def __init__(self, text, a, b, s):
+        self.a = HistoricPosition(text, a)
+        self.b = HistoricPosition(text, b)
+        self.len_utf16 = len(text[a:b].encode('utf-16-le')) // 2
+        self.len_utf8 = len(text[a:b].encode('utf-8'))
+        self.str = s
+
+
+class Buffer(object):
+    def __init__(self, view):
+        self.view = view
+
+    def id(self):
+        return self.view.buffer_id()
+
+    def primary_view(self):
+        return self.view
+
+
+def bench_buf_from_view(plugin, sizes, repeat):
+    import sublime
+    results = []
+    handler = plugin.SublimeCodeIntel()
+    for size in sizes:
+        for deltas in (True, False):
+            window = sublime.active_window()
+            view = window.new_file(make_source(size), file_name='/tmp/bench_%d.py' % size)
+            listener = None
+            if deltas and hasattr(plugin, 'CodeintelTextChangeListener'):
+                listener = plugin.CodeintelTextChangeListener()
+                listener.buffer = Buffer(view)
+            handler.buf_from_view(view)
+
+            def type_char():
+                pos = view.sel()[0].end()
+                change = TextChange(view.substr(sublime.Region(0, view.size())), pos, pos, 'x')
+                view.insert_text(pos, 'x')
+                if listener:
+                    listener.on_text_changed([change])
+            timings = measure(lambda: handler.buf_from_view(view), repeat, setup=type_char)
+            results.append(summarize('buf_from_view', {'size': size, 'deltas': bool(listener)}, timings))
+            handler.on_close(view)
+    return results
+
+
+def bench_supersede(plugin, repeat):
+    """Time triggers superseding a request still pending in the backend."""
+    import sublime
+    mgr = plugin.ci.mgr
+    stats = plugin.trigger_scheduler.stats
+    window = sublime.active_window()
+    view = window.new_file("obj.", file_name='/tmp/bench_supersede.py')
+    command = plugin.CodeintelAutoCompleteCommand(view)
+    cancelled = stats()['cancelled']
+    mgr.deferred = True
+    try:
+        command.run(None)  # left pending in the backend
+
+        def run():
+            command.run(None)
+        timings = measure(run, repeat)
+        mgr.respond()
+        # Only the last request goes on to be evaluated:
+        if stats()['cancelled'] - cancelled != repeat or len(mgr.requests) != 1:
+            raise AssertionError("superseded requests were evaluated: %d cancelled, %d pending" % (
+                stats()['cancelled'] - cancelled, len(mgr.requests)))
+    finally:
+        mgr.deferred = False
+        mgr.respond()
+        sublime.run_timeouts()
+        plugin.SublimeCodeIntel().on_close(view)
+    return [summarize('supersede', {}, timings)]
+
+
+def bench_pos2bytes(plugin, sizes, repeat):
+    import sublime
+    results = []
+    for size in sizes:
+        for non_ascii in (False, True):
+            for index in ('cold', 'warm'):
+                view = sublime.View(make_source(size, non_ascii))
+                mirror = plugin.TextMirror()
+                mirror.sync(view)
+                if index == 'warm':
+                    # The index is only built once deltas flow:
+                    view.insert_text(0, '#')
+                    mirror.apply([(0, 0, '#')], view.change_count(), view.size())
+                    mirror.pos2bytes(0)
+                positions = [int(size * f) for f in (0.1, 0.5, 0.9, 1.0)]
+
+                def run():
+                    for pos in positions:
+                        mirror.pos2bytes(pos)
+                timings = measure(run, repeat)
+                timings = [t / len(positions) for t in timings]
+                results.append(summarize('pos2bytes', {'size': size, 'non_ascii': non_ascii, 'index': index}, timings))
+    return results
+
+
+def bench_format_completions(plugin, counts, repeat):
+    results = []
+    handler = plugin.SublimeCodeIntel()
+    for count in counts:
+        cplns = make_completions(count)
+        for lang in ('Python', 'PHP'):
+            def cold():
+                plugin.CodeintelHandler.completion_formatters.clear()
+
+            def run():
+                handler.format_completions_by_language(cplns, lang, 'obj.', 'object-members')
+            timings = measure(run, repeat, setup=cold)
+            results.append(summarize('format_completions_by_language', {'count': count, 'lang': lang, 'warm': False}, timings))
+            timings = measure(run, repeat)
+            results.append(summarize('format_completions_by_language', {'count': count, 'lang': lang, 'warm': True}, timings))
+    return results
+
+
+def bench_call_tip(plugin, params, repeat):
+    import sublime
+    results = []
+    handler = plugin.SublimeCodeIntel()
+    window = sublime.active_window()
+    for count in params:
+        view = window.new_file("func(a, ", file_name='/tmp/bench_calltip.py')
+        buf = handler.buf_from_view(view)
+        args = ', '.join('arg%d=%d' % (i, i) for i in range(count))
+        calltip = "func(%s)\n%s" % (args, "Documentation line that is long enough to be wrapped. " * 10)
+
+        def run():
+            handler.set_call_tip_info(buf, calltip, False, {'type': 'call-signature'})
+            sublime.run_timeouts()
+        timings = measure(run, repeat)
+        results.append(summarize('set_call_tip_info', {'params': count}, timings))
+        handler.on_close(view)
+    return results
+
+
+def bench_get_prefs(plugin, repeat):
+    settings = plugin.settings
+    results = []
+    for lang in (None, 'Python', 'PHP'):
+        timings = measure(lambda: settings.get_prefs(lang), repeat, setup=settings.invalidate_prefs)
+        results.append(summarize('get_prefs', {'lang': lang, 'cached': False}, timings))
+        timings = measure(lambda: settings.get_prefs(lang), repeat)
+        results.append(summarize('get_prefs', {'lang': lang, 'cached': True}, timings))
+    return results
+
+
+def bench_on_change(plugin, repeat):
+    settings = plugin.settings
+    return [summarize('Settings.on_change', {}, measure(settings.on_change, repeat))]
+
+
+def run(args):
+    plugin = load_plugin()
+    repeat = args.repeat
+    if args.quick:
+        sizes = [10 * 1024, 100 * 1024]
+        counts = [100, 1000]
+    else:
+        sizes = [10 * 1024, 100 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+        counts = [100, 1000, 20000]
+
+    results = []
+    results.extend(bench_buf_from_view(plugin, sizes, repeat))
+    results.extend(bench_supersede(plugin, repeat))
+    results.extend(bench_pos2bytes(plugin, sizes, repeat))
+    results.extend(bench_format_completions(plugin, counts, repeat))
+    results.extend(bench_call_tip(plugin, [2, 8, 32], repeat))
+    results.extend(bench_get_prefs(plugin, repeat))
+    results.extend(bench_on_change(plugin, repeat))
+
+    return {
+        'meta': {
+            'plugin_version': plugin.VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+
+
+def key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(report, baseline, threshold):
+    """Print the median ratios against baseline, return the regressions."""
+    previous = dict((key(r), r) for r in baseline['results'])
+    regressions = []
+    for result in report['results']:
+        before = previous.get(key(result))
+        if not before or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        flag = ''
+        if ratio > threshold:
+            flag = '  <-- regression'
+            regressions.append(result)
+        print("%-32s %-48s %10.4fms %10.4fms %6.2fx%s" % (
+            result['name'], key(result)[1], before['median_ms'], result['median_ms'], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SublimeCodeIntel hot paths micro-benchmarks")
+    parser.add_argument('-o', '--output', help="write the JSON results to this file (default: stdout)")
+    parser.add_argument('-r', '--repeat', type=int, default=20, help="runs per benchmark (default: 20)")
+    parser.add_argument('-q', '--quick', action='store_true', help="only use the small sizes")
+    parser.add_argument('-c', '--compare', help="JSON results of a previous run to compare against")
+    parser.add_argument('-t', '--threshold', type=float, default=1.25,
+                        help="median slowdown ratio considered a regression (default: 1.25)")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
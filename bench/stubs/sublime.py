@@ -0,0 +1,243 @@
+"""
+Minimal stand-in for the Sublime Text `sublime` module, enough to import
+and drive SublimeCodeIntel outside of the editor.
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import re
+import json
+import tempfile
+
+OP_EQUAL = 0
+OP_NOT_EQUAL = 1
+ENCODED_POSITION = 1
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_timeouts = []
+_cache_path = None
+
+
+def version():
+    return '4000'
+
+
+def set_timeout(callback, delay=0):
+    _timeouts.append(callback)
+
+
+set_timeout_async = set_timeout
+
+
+def run_timeouts():
+    """Run all the pending callbacks (in the order they were scheduled)."""
+    while _timeouts:
+        callback = _timeouts.pop(0)
+        callback()
+
+
+def packages_path():
+    return os.path.dirname(PACKAGE_PATH)
+
+
+def cache_path():
+    global _cache_path
+    if _cache_path is None:
+        _cache_path = tempfile.mkdtemp(prefix='sublime-cache-')
+    return _cache_path
+
+
+def status_message(msg):
+    pass
+
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def size(self):
+        return abs(self.b - self.a)
+
+
+class Settings(dict):
+    def set(self, key, value):
+        self[key] = value
+
+    def clear_on_change(self, key):
+        pass
+
+    def add_on_change(self, key, callback):
+        pass
+
+
+_settings = {}
+
+
+def load_settings(name):
+    try:
+        return _settings[name]
+    except KeyError:
+        pass
+    settings = Settings()
+    path = os.path.join(PACKAGE_PATH, name)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            content = f.read().decode('utf-8')
+        content = re.sub(r'/\*.*?\*/', '', content, flags=re.S)
+        settings.update(json.loads(content))
+    _settings[name] = settings
+    return settings
+
+
+def save_settings(name):
+    pass
+
+
+class View(object):
+    _next_id = 0
+
+    def __init__(self, text='', syntax='Packages/Python/Python.sublime-syntax', file_name=None, window=None):
+        View._next_id += 1
+        self._id = View._next_id
+        self._text = text
+        self._sel = [Region(len(text))]
+        self._change_count = 0
+        self._settings = Settings(syntax=syntax)
+        self._file_name = file_name
+        self._window = window
+        self._status = {}
+        self._history = []
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._id
+
+    def is_valid(self):
+        return True
+
+    def is_dirty(self):
+        return False
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def settings(self):
+        return self._settings
+
+    def size(self):
+        return len(self._text)
+
+    def sel(self):
+        return self._sel
+
+    def change_count(self):
+        return self._change_count
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self._text[x.begin():x.end()]
+        return self._text[x:x + 1]
+
+    def line(self, x):
+        pos = x.begin() if isinstance(x, Region) else x
+        start = self._text.rfind('\n', 0, pos) + 1
+        end = self._text.find('\n', pos)
+        return Region(start, len(self._text) if end == -1 else end)
+
+    def rowcol(self, pos):
+        return self._text.count('\n', 0, pos), pos - (self._text.rfind('\n', 0, pos) + 1)
+
+    def word(self, x):
+        pos = x.begin() if isinstance(x, Region) else x
+        start = end = pos
+        while start > 0 and (self._text[start - 1].isalnum() or self._text[start - 1] == '_'):
+            start -= 1
+        while end < len(self._text) and (self._text[end].isalnum() or self._text[end] == '_'):
+            end += 1
+        return Region(start, end)
+
+    def insert_text(self, pos, text):
+        self._text = self._text[:pos] + text + self._text[pos:]
+        self._change_count += 1
+        self._sel = [Region(pos + len(text))]
+        self._history.append(('insert', {'characters': text}, 1))
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def run_command(self, cmd, args=None):
+        pass
+
+    def show_popup(self, content, flags=0, location=-1, max_width=320, max_height=240, on_navigate=None, on_hide=None):
+        pass
+
+    def hide_popup(self):
+        pass
+
+    def command_history(self, index, modifying_only=False):
+        if index > 0 or -index >= len(self._history):
+            return (None, None, 0)
+        return self._history[index - 1]
+
+
+class Window(object):
+    def __init__(self, folders=()):
+        self._folders = list(folders)
+        self._views = []
+
+    def id(self):
+        return 1
+
+    def folders(self):
+        return self._folders
+
+    def views(self):
+        return self._views
+
+    def active_view(self):
+        return self._views[-1] if self._views else None
+
+    def new_file(self, text='', syntax='Packages/Python/Python.sublime-syntax', file_name=None):
+        view = View(text, syntax, file_name, self)
+        self._views.append(view)
+        return view
+
+    def run_command(self, cmd, args=None):
+        pass
+
+    def open_file(self, fname, flags=0):
+        pass
+
+    def create_output_panel(self, name):
+        return View(window=self)
+
+
+_window = Window()
+
+
+def active_window():
+    return _window
+
+
+def windows():
+    return [_window]
@@ -0,0 +1,28 @@
+"""
+Minimal stand-in for the Sublime Text `sublime_plugin` module.
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+
+class EventListener(object):
+    pass
+
+
+class TextChangeListener(object):
+    def __init__(self, buffer=None):
+        self.buffer = buffer
+
+
+class ApplicationCommand(object):
+    pass
+
+
+class WindowCommand(object):
+    def __init__(self, window=None):
+        self.window = window
+
+
+class TextCommand(object):
+    def __init__(self, view=None):
+        self.view = view
@@ -0,0 +1,552 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import sys
+from collections import deque, OrderedDict
+
+import sublime
+
+
+OUTLINE_RE = re.compile(
+    r'(?:[^\s}\])]|\s*(?:'
+    r'import|from|require|use|include|package|namespace|module|'
+    r'class|interface|trait|struct|enum|typedef|function|def|sub|'
+    r'var|let|const|export|public|private|protected|static|abstract|final'
+    r')\b)'
+)
+
+
+class OffsetIndex(object):
+    """
+    Character to UTF-8 byte offset index (and back) for a text.
+
+    Keeps the length in characters and in bytes of every line, in blocks of
+    about BLOCK lines, and the number of lines, characters and bytes of the
+    blocks in Fenwick trees, so line starts are found in O(log n + BLOCK).
+    Edits only measure the lines they touch and update the blocks those are
+    in; the trees are rebuilt only when blocks have to be split (or run out
+    of lines), so inserting or removing lines stays sub-linear too. Lines
+    that are pure ASCII are mapped arithmetically; only positions in lines
+    marked as non-ASCII need to encode (part of) that single line.
+
+    """
+    BLOCK = 64
+
+    def __init__(self, text):
+        self.build(text)
+
+    @staticmethod
+    def measure(lines, last):
+        chars, nbytes, ascii = [], [], []
+        for i, line in enumerate(lines):
+            n = len(line)
+            b = len(line.encode('utf-8'))
+            if i != last:
+                n += 1
+                b += 1
+            chars.append(n)
+            nbytes.append(b)
+            ascii.append(n == b)
+        return chars, nbytes, ascii
+
+    def build(self, text):
+        lines = text.split('\n')
+        self.blocks = self._split(*self.measure(lines, len(lines) - 1))
+        self.block_chars = [sum(c) for c, b, a in self.blocks]
+        self.block_bytes = [sum(b) for c, b, a in self.blocks]
+        self._build_trees()
+
+    def _split(self, chars, nbytes, ascii, count=None):
+        """Split lines in `count` blocks (or in blocks of BLOCK lines)."""
+        size = len(chars)
+        if count is None:
+            count = max(1, -(-size // self.BLOCK))
+        bounds = [size * i // count for i in range(count + 1)]
+        return [(chars[a:b], nbytes[a:b], ascii[a:b]) for a, b in zip(bounds, bounds[1:])]
+
+    def _build_trees(self):
+        size = len(self.blocks)
+        self._size = size
+        self._step = 1 << (size.bit_length() - 1) if size else 0
+        self._fl = self._fenwick([len(c) for c, b, a in self.blocks])
+        self._fc = self._fenwick(self.block_chars)
+        self._fb = self._fenwick(self.block_bytes)
+
+    @staticmethod
+    def _fenwick(values):
+        size = len(values)
+        tree = [0] + values
+        for i in range(1, size + 1):
+            j = i + (i & -i)
+            if j <= size:
+                tree[j] += tree[i]
+        return tree
+
+    @staticmethod
+    def _prefix(tree, i):
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _add(self, tree, i, delta):
+        i += 1
+        while i <= self._size:
+            tree[i] += delta
+            i += i & -i
+
+    def _find(self, tree, offset):
+        """Return (block, block start) of the block containing offset."""
+        i = 0
+        rem = offset
+        step = self._step
+        while step:
+            j = i + step
+            if j <= self._size and tree[j] <= rem:
+                i = j
+                rem -= tree[j]
+            step >>= 1
+        if i >= self._size:
+            i = self._size - 1
+            return i, self._prefix(tree, i)
+        return i, offset - rem
+
+    def _line(self, offset, in_bytes=False):
+        """
+        Return (block, line in the block, character start, byte start) of
+        the line containing the character (or byte) offset.
+
+        """
+        block, start = self._find(self._fb if in_bytes else self._fc, offset)
+        chars, nbytes, ascii = self.blocks[block]
+        if in_bytes:
+            lengths, cstart, bstart = nbytes, self._prefix(self._fc, block), start
+        else:
+            lengths, cstart, bstart = chars, start, self._prefix(self._fb, block)
+        rem = offset - start
+        last = len(lengths) - 1
+        i = 0
+        while i < last and lengths[i] <= rem:
+            rem -= lengths[i]
+            cstart += chars[i]
+            bstart += nbytes[i]
+            i += 1
+        return block, i, cstart, bstart
+
+    def line_starts(self, line):
+        """Return the (character, byte) offsets where the line starts."""
+        block, first = self._find(self._fl, line)
+        chars, nbytes, ascii = self.blocks[block]
+        n = line - first
+        return self._prefix(self._fc, block) + sum(chars[:n]), self._prefix(self._fb, block) + sum(nbytes[:n])
+
+    def pos2bytes(self, text, pos):
+        block, i, cstart, bstart = self._line(pos)
+        if self.blocks[block][2][i]:
+            return bstart + pos - cstart
+        return bstart + len(text[cstart:pos].encode('utf-8'))
+
+    def bytes2pos(self, text, offset):
+        block, i, cstart, bstart = self._line(offset, True)
+        chars, nbytes, ascii = self.blocks[block]
+        if ascii[i]:
+            return cstart + offset - bstart
+        encoded = text[cstart:cstart + chars[i]].encode('utf-8')
+        return cstart + len(encoded[:offset - bstart].decode('utf-8', 'ignore'))
+
+    def update(self, text, start, end, length):
+        """
+        Update the index after the characters in [start, end) were replaced
+        by `length` characters, `text` being the resulting text.
+
+        """
+        first, i, first_start, _ = self._line(start)
+        last, j, last_start, _ = self._line(end)
+        blocks = self.blocks
+        last_end = last_start + blocks[last][0][j] + length - (end - start)
+        is_last = last == self._size - 1 and j == len(blocks[last][0]) - 1
+        lines = text[first_start:last_end].split('\n')
+        if not is_last:
+            lines.pop()  # region ends right after a newline
+        chars, nbytes, ascii = self.measure(lines, len(lines) - 1 if is_last else -1)
+
+        if first == last and len(chars) == j - i + 1:
+            # Same lines in the same block (the usual edit within a line):
+            block = blocks[first]
+            self._resize(first, sum(chars) - sum(block[0][i:j + 1]), sum(nbytes) - sum(block[1][i:j + 1]))
+            block[0][i:j + 1] = chars
+            block[1][i:j + 1] = nbytes
+            block[2][i:j + 1] = ascii
+            return
+
+        # The lines of the blocks touched, with the edited ones replaced:
+        head, tail = blocks[first], blocks[last]
+        chars = head[0][:i] + chars + tail[0][j + 1:]
+        nbytes = head[1][:i] + nbytes + tail[1][j + 1:]
+        ascii = head[2][:i] + ascii + tail[2][j + 1:]
+
+        count = last - first + 1
+        if count <= len(chars) <= 2 * self.BLOCK * count:
+            # Spread them over the same blocks, the trees only need updates:
+            for k, block in enumerate(self._split(chars, nbytes, ascii, count), first):
+                self._add(self._fl, k, len(block[0]) - len(blocks[k][0]))
+                self._resize(k, sum(block[0]) - self.block_chars[k], sum(block[1]) - self.block_bytes[k])
+                blocks[k] = block
+        else:
+            split = self._split(chars, nbytes, ascii)
+            blocks[first:last + 1] = split
+            self.block_chars[first:last + 1] = [sum(c) for c, b, a in split]
+            self.block_bytes[first:last + 1] = [sum(b) for c, b, a in split]
+            self._build_trees()
+
+    def _resize(self, block, chars, nbytes):
+        """Add to the characters and bytes of a block."""
+        if chars:
+            self.block_chars[block] += chars
+            self._add(self._fc, block, chars)
+        if nbytes:
+            self.block_bytes[block] += nbytes
+            self._add(self._fb, block, nbytes)
+
+
+class TextMirror(object):
+    """
+    Keeps a plugin-side copy of a buffer's text.
+
+    The copy is versioned with the view's change count and kept up to date
+    by applying edit deltas, so the whole document only has to be fetched
+    from the view (a full resync) when the mirror and the view diverge.
+    This is local to the plugin: CodeIntel is still handed the whole text
+    of a buffer that changed (the client has no way of sending deltas).
+
+    """
+    MAX_CHANGES = 256
+
+    def __init__(self):
+        self.text = None
+        self.version = None
+        self.base = None  # oldest version reachable through self.changes
+        self.changes = deque()  # (version, start, end, text)
+        self._index = None
+        self.resyncs = 0
+        self.deltas = 0
+
+    def invalidate(self):
+        """Drop the copy, the next sync will do a full resync."""
+        self.text = None
+        self.version = None
+        self.base = None
+        self.changes.clear()
+        self._index = None
+
+    def sync(self, view):
+        """Return the text of the view, resyncing only when versions diverge."""
+        change_count = getattr(view, 'change_count', None)
+        version = change_count() if change_count else None
+        if self.text is None or version is None or version != self.version:
+            self.resync(view, version)
+        return self.text
+
+    def resync(self, view, version):
+        self.text = view.substr(sublime.Region(0, view.size()))
+        self.version = version
+        self.base = version
+        self.changes.clear()
+        self._index = None
+        self.resyncs += 1
+
+    @property
+    def index(self):
+        """
+        The offset index of the text, or None while it's not worth building:
+        right after a resync the text is likely to be fetched again before
+        the index is reused, so it's only built once edit deltas flow.
+
+        """
+        if self._index is None and self.changes:
+            self._index = OffsetIndex(self.text)
+        return self._index
+
+    def pos2bytes(self, pos):
+        """Return the UTF-8 byte offset of the character position pos."""
+        index = self.index
+        if index is None:
+            return len(self.text[:pos].encode('utf-8'))
+        return index.pos2bytes(self.text, pos)
+
+    def bytes2pos(self, offset):
+        """Return the character position of the UTF-8 byte offset."""
+        index = self.index
+        if index is None:
+            return len(self.text.encode('utf-8')[:offset].decode('utf-8', 'ignore'))
+        return index.bytes2pos(self.text, offset)
+
+    def apply(self, changes, new_version, size):
+        """
+        Apply a list of (start, end, text) edits, made on top of the mirrored
+        version, which leave the buffer at `new_version` with `size`
+        characters.
+
+        Edits are applied in order, each one relative to the text left by
+        the previous one. Edits for versions already mirrored are ignored.
+        Returns False (and invalidates the mirror) if the resulting text
+        doesn't have the expected size, as the edits were then not made on
+        top of the mirrored text.
+
+        """
+        if self.text is None or self.version is None:
+            return False
+        if new_version <= self.version:
+            return False  # already resynced past these edits
+
+        text = self.text
+        index = self._index
+        for start, end, s in changes:
+            text = text[:start] + s + text[end:]
+            if index is not None:
+                index.update(text, start, end, len(s))
+            self.changes.append((new_version, start, end, s))
+            self.deltas += 1
+        if len(text) != size:
+            self.invalidate()
+            return False
+        while len(self.changes) > self.MAX_CHANGES:
+            self.base = self.changes.popleft()[0]
+        self.text = text
+        self.version = new_version
+        return True
+
+    def changes_since(self, version):
+        """
+        Return the list of (start, end, text) edits that take the buffer from
+        `version` to the current version, or None if they are not known (in
+        which case the full text should be used).
+
+        """
+        if version is None or self.version is None or self.base is None:
+            return None
+        if version == self.version:
+            return []
+        if version < self.base or version > self.version:
+            return None
+        return [(start, end, s) for v, start, end, s in self.changes if v > version]
+
+
+class TextWindow(object):
+    """
+    Window of text around the cursor for files too large to be sent whole.
+
+    The text handed to the backend is the window itself plus an outline of
+    the rest of the file: lines that look like top level declarations are
+    kept and every other line is blanked, so line numbers coming back from
+    the backend still match the view. The outline is cached and only
+    rebuilt when the cursor leaves the window or when an edit happens
+    outside of it. Edits are followed through the deltas of the mirror or,
+    when those are not known (after a resync), by checking the text before
+    and after the window didn't change.
+
+    """
+    MAX_SNAP = 4096  # max distance to move the window edges to line breaks
+    MAX_OUTLINE_LINE = 512
+
+    def __init__(self, size):
+        self.size = size
+        self.start = None
+        self.end = None
+        self.snapped_end = False
+        self.version = None
+        self.before = None  # text before the window
+        self.after = None  # text after the window
+        self.head = None
+        self.tail = None
+        self.head_bytes = 0
+        self.rebuilds = 0
+
+    def outline(self, lines):
+        max_len = self.MAX_OUTLINE_LINE
+        return [l if len(l) <= max_len and OUTLINE_RE.match(l) else '' for l in lines]
+
+    def _follow(self, mirror):
+        """Follow edits made since the last version, if all fall in the window."""
+        if self.start is None:
+            return False
+        changes = mirror.changes_since(self.version)
+        if changes is None:
+            text = mirror.text
+            if len(text) < len(self.before) + len(self.after) or not text.startswith(self.before) or not text.endswith(self.after):
+                return False
+            end = len(text) - len(self.after)
+        else:
+            end = self.end
+            for start, stop, s in changes:
+                if start < self.start or stop > end:
+                    return False
+                end += len(s) - (stop - start)
+        self.end = end
+        self.version = mirror.version
+        return True
+
+    def _build(self, text, pos):
+        size = len(text)
+        half = self.size // 2
+        start = max(0, pos - half)
+        end = min(size, pos + half)
+
+        line_start = text.rfind('\n', 0, start) + 1
+        if start - line_start <= self.MAX_SNAP:
+            start = line_start
+        snapped_end = False
+        if end < size:
+            line_end = text.find('\n', end, end + self.MAX_SNAP)
+            if line_end != -1:
+                end = line_end + 1
+                snapped_end = True
+
+        self.before = text[:start]
+        self.after = text[end:]
+        head = self.outline(self.before.split('\n'))
+        head[-1] = ''  # part of the first line in the window
+        tail = self.outline(self.after.split('\n'))
+        if not snapped_end:
+            tail[0] = ''  # part of the last line in the window
+
+        self.start = start
+        self.end = end
+        self.snapped_end = snapped_end
+        self.head = '\n'.join(head)
+        self.tail = '\n'.join(tail)
+        self.head_bytes = len(self.head.encode('utf-8'))
+        self.rebuilds += 1
+
+    def sync(self, mirror, pos):
+        """
+        Return the text to send for the mirrored text with the cursor at
+        pos, and the UTF-8 byte offset of pos in that text.
+
+        """
+        text = mirror.text
+        if not self._follow(mirror) or not self._contains(pos, len(text)):
+            self._build(text, pos)
+            self.version = mirror.version
+        window = text[self.start:self.end]
+        return self.head + window + self.tail, self.head_bytes + len(text[self.start:pos].encode('utf-8'))
+
+    def _contains(self, pos, size):
+        margin = self.size // 8
+        low = self.start + margin if self.start > 0 else 0
+        high = self.end - margin if self.end < size else size
+        return low <= pos <= high
+
+    def bytes2pos(self, mirror, offset):
+        """Return the view position of a byte offset in the text sent."""
+        offset -= self.head_bytes
+        if offset < 0:
+            return self.start
+        encoded = mirror.text[self.start:self.end].encode('utf-8')
+        return self.start + len(encoded[:offset].decode('utf-8', 'ignore'))
+
+    @property
+    def weight(self):
+        """Memory held by the window, in bytes."""
+        return sum(sys.getsizeof(s) for s in (self.before, self.after, self.head, self.tail) if s)
+
+
+class BufferRegistry(object):
+    """
+    Memory budget for the buffers of the views.
+
+    Views are kept in least recently used order. Whenever the estimated
+    memory held by the buffers (their text, the mirrored text and the
+    completions) goes over the budget, the least recently used views,
+    never the current one, are evicted: their text and completions are
+    dropped, but the buffers stay registered with their metadata (language,
+    path...) and get their text back the next time the view is used.
+
+    """
+    ROW_OVERHEAD = 160  # rough per-completion memory overhead, in bytes
+
+    def __init__(self, budget=None, release=None):
+        self.budget = budget
+        self.release = release  # called with (vid, buf) on eviction
+        self.usage = 0
+        self.evictions = 0
+        self.rehydrations = 0
+        self._entries = OrderedDict()  # map of vid -> [buf, weight, resident]
+
+    @classmethod
+    def weigh(cls, buf):
+        weight = 0
+        text = getattr(buf, 'text', None)
+        if text:
+            weight += sys.getsizeof(text)
+        mirror = getattr(buf, 'mirror', None)
+        if mirror is not None and mirror.text and mirror.text is not text:
+            weight += sys.getsizeof(mirror.text)
+        text_window = getattr(buf, 'text_window', None)
+        if text_window is not None:
+            weight += text_window.weight
+        cplns = getattr(buf, 'cplns', None)
+        if cplns:
+            weight += cls.ROW_OVERHEAD * len(cplns)
+        return weight
+
+    def touch(self, vid, buf):
+        """Mark the buffer of the view as the most recently used one."""
+        entry = self._entries.pop(vid, None)
+        if entry is not None:
+            self.usage -= entry[1]
+            if not entry[2]:
+                self.rehydrations += 1
+        weight = self.weigh(buf)
+        self._entries[vid] = [buf, weight, True]
+        self.usage += weight
+        self.shrink()
+
+    def forget(self, vid):
+        entry = self._entries.pop(vid, None)
+        if entry is not None:
+            self.usage -= entry[1]
+
+    def resize(self, budget):
+        self.budget = budget
+        self.shrink()
+
+    def shrink(self):
+        if not self.budget or self.usage <= self.budget:
+            return
+        # The most recently used view is the last one, never evict it:
+        for vid in list(self._entries)[:-1]:
+            if self.usage <= self.budget:
+                break
+            entry = self._entries[vid]
+            if entry[2]:
+                self.evict(vid, entry)
+
+    def evict(self, vid, entry):
+        buf = entry[0]
+        mirror = getattr(buf, 'mirror', None)
+        if self.release:
+            self.release(vid, buf)
+        buf.text = None
+        buf.cplns = None
+        buf.version = None
+        buf.mirror = None
+        buf.text_window = None
+        if mirror is not None and not any(e[2] and getattr(e[0], 'mirror', None) is mirror for e in self._entries.values()):
+            # No other resident view shares the buffer:
+            mirror.invalidate()
+        self.usage -= entry[1]
+        entry[1] = 0
+        entry[2] = False
+        self.evictions += 1
+
+    def stats(self):
+        return {
+            'views': len(self._entries),
+            'resident': sum(1 for e in self._entries.values() if e[2]),
+            'usage': self.usage,
+            'budget': self.budget,
+            'evictions': self.evictions,
+            'rehydrations': self.rehydrations,
+        }
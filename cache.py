@@ -0,0 +1,93 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread safe least recently used cache.
+
+    Entries are evicted in LRU order whenever there are more than max_size
+    of them or, if a weigher is given, when the total weight of the entries
+    exceeds max_weight.
+
+    """
+
+    def __init__(self, max_size=128, max_weight=None, weigher=None):
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (value, weight)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, weight = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = (value, weight)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        weight = self.weigher(value) if self.weigher else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.weight -= old[1]
+            self._data[key] = (value, weight)
+            self.weight += weight
+            self._shrink()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, weight = self._data.pop(key)
+            except KeyError:
+                return default
+            self.weight -= weight
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def resize(self, max_size=None, max_weight=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if max_weight is not None:
+                self.max_weight = max_weight
+            self._shrink()
+
+    def _shrink(self):
+        while self._data and (
+            len(self._data) > self.max_size or
+            self.max_weight is not None and self.weight > self.max_weight
+        ):
+            key, (value, weight) = self._data.popitem(last=False)
+            self.weight -= weight
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'weight': self.weight,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
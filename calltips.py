@@ -0,0 +1,125 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import textwrap
+
+from .cache import LRUCache
+
+
+SIGNATURE_RE = re.compile(r'^(.*\()([^\[\(\)]*)(.*)$')
+
+CSS = (
+    "html {background-color: #232628; color: #999999;}" +
+    "body {font-size: 10px; }" +
+    "b {color: #6699cc; }" +
+    "a {color: #99cc99; }" +
+    "h1 {color: #cccccc; font-weight: normal; font-size: 11px; }"
+)
+
+
+class CalltipCache(object):
+    """
+    Cache of parsed and rendered calltips.
+
+    Parsing a calltip (splitting the signature into parameters and wrapping
+    the documentation lines) is cached by the calltip text, and rendering
+    (the tip lines, with the current parameter highlighted, the popup HTML
+    and the parameters snippet) by (calltip, argument index, separator), so
+    moving through the arguments of a call only renders the signature line
+    again.
+
+    """
+
+    def __init__(self, max_size=64):
+        self.parsed = LRUCache(max_size)
+        self.rendered = LRUCache(max_size * 4)
+        self.wrapper = textwrap.TextWrapper(width=100, break_on_hyphens=False, break_long_words=False)
+
+    def parse(self, calltip):
+        """
+        Return (signature, params, lines, first line) for the calltip. The
+        signature is None if the first line doesn't look like one, otherwise
+        it's (head, tail) surrounding the params, a list of (index, html,
+        snippet variable). lines are the rest of the calltip, wrapped.
+
+        """
+        parsed = self.parsed.get(calltip)
+        if parsed is not None:
+            return parsed
+
+        # TODO: This snippets are created and work for Python language def functions.
+        # i.e. in the form: name(arg1, arg2, arg3)
+        # Other languages might need different treatment.
+        tip_info = calltip.split('\n')
+        signature = None
+        params = []
+        m = SIGNATURE_RE.search(tip_info[0])
+        if m:
+            signature = (m.group(1), m.group(3))
+            for i, p in enumerate(m.group(2).split(',')):
+                p = p.strip()
+                if p:
+                    var, sep, default = p.partition('=')
+                    var = var.strip()
+                    tvar = var
+                    if sep:
+                        tvar = "%s<i>=%s</i>" % (tvar, default)
+                    if ' ' in var:
+                        var = var.split(' ')[1]
+                    if var[:1] == '$':
+                        var = var[1:]
+                    params.append((i, tvar, var))
+
+        # Wrap lines that are too long:
+        lines = []
+        for t in tip_info[1:]:
+            lines.extend(self.wrapper.wrap(t))
+
+        parsed = (signature, params, lines, tip_info[0])
+        self.parsed.set(calltip, parsed)
+        return parsed
+
+    def render(self, calltip, arguments, initial_separator=''):
+        """
+        Return (tips, html, snippet) for the calltip when arguments have
+        already been typed: the tip lines, the popup HTML and the snippet
+        with the parameters left.
+
+        """
+        key = (calltip, arguments, initial_separator)
+        rendered = self.rendered.get(key)
+        if rendered is not None:
+            return rendered
+
+        signature, params, lines, tip0 = self.parse(calltip)
+        snippet = None
+        if signature:
+            n = 1
+            tip0 = []
+            snippet = []
+            for i, tvar, var in params:
+                tip0.append("<b>%s</b>" % tvar if i == arguments else tvar)
+                if i >= arguments:
+                    snippet.append('${%s:%s}' % (n, var))
+                    n += 1
+            tip0 = "<h1>%s%s%s</h1>" % (signature[0], ', '.join(tip0), signature[1])
+            snippet = ', '.join(snippet)
+            if arguments and snippet:
+                snippet = initial_separator + snippet
+
+        tips = [tip0] + lines
+        html = '<style>%s</style>%s<br><br><a href="insert">insert</a>' % (CSS, "<br>".join(tips))
+        rendered = (tips, html, snippet)
+        self.rendered.set(key, rendered)
+        return rendered
+
+    def stats(self):
+        parsed = self.parsed.stats()
+        rendered = self.rendered.stats()
+        return {
+            'parsed': parsed['entries'],
+            'parsed_hits': parsed['hits'],
+            'rendered': rendered['entries'],
+            'rendered_hits': rendered['hits'],
+            'misses': rendered['misses'],
+        }
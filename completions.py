@@ -0,0 +1,302 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import heapq
+import itertools
+
+import sublime
+
+from .cache import LRUCache
+
+
+IDENTIFIER_RE = re.compile(r'^[\w$]*$', re.UNICODE)
+
+KIND_RANKS = {
+    'import': '_',
+    'attribute': '__',
+    'variable': '__',
+    'function': '___',
+}
+
+
+class CompletionFormatter(object):
+    """
+    Formats CodeIntel completions, (type, name[, description]) tuples, for
+    a given language and trigger type into Sublime Text completion rows.
+
+    Sort keys and formatted rows are memoized per completion, and when there
+    are more than `limit` completions only the first `limit` (in sort order)
+    are selected and formatted.
+
+    """
+    MEMO_SIZE = 65536
+
+    def __init__(self, lang, type, function, limit=None):
+        self.limit = limit
+        self.function = function
+        self.kind_ranks = {}  # map of completion type -> rank
+        self.memo = {}  # map of completion -> (sort key, row)
+
+        if lang == 'PHP' and type != 'object-members':
+            self.get_name = self._php_name
+        elif lang == 'ECMAScript':
+            self.get_name = self._ecmascript_name
+        else:
+            self.get_name = self._name
+
+    def _php_name(self, c):
+        name = c[1]
+        if c[0] == 'variable':
+            name = "$" + name
+        name = name.replace("$", "\\$")
+        if c[0] == self.function:
+            name += "($0)"
+        return name
+
+    def _ecmascript_name(self, c):
+        name = c[1]
+        name = name.replace("$", "\\$")
+        if c[0] == 'attribute':
+            name += "=$0 "
+        elif c[0] == self.function:
+            name += "($0)"
+        return name
+
+    def _name(self, c):
+        name = c[1]
+        name = name.replace("$", "\\$")
+        if c[0] == self.function:
+            name += "($0)"
+        return name
+
+    def _rank(self, kind):
+        try:
+            return self.kind_ranks[kind]
+        except KeyError:
+            rank = self.kind_ranks[kind] = KIND_RANKS.get(kind.lower(), kind)
+            return rank
+
+    def _compile(self, c):
+        desc = c[2] if len(c) > 2 else c[1]
+        row = ('%s\t〔%s〕' % (desc, c[0].title()), self.get_name(c))
+        # Flat sort key, ordered as (rank, name) would be (NUL sorts first):
+        return '%s\0%s' % (self._rank(c[0]), c[1]), row
+
+    def decorate(self, cplns):
+        """Return the list of (sort key, row) for the completions."""
+        memo = self.memo
+        if len(memo) > self.MEMO_SIZE:
+            memo.clear()
+
+        decorated = []
+        for c in cplns:
+            key = c if isinstance(c, tuple) else tuple(c)
+            try:
+                entry = memo[key]
+            except KeyError:
+                entry = memo[key] = self._compile(key)
+            decorated.append(entry)
+        return decorated
+
+    def select(self, decorated):
+        """Return the rows of the first `limit` decorated completions, sorted."""
+        if self.limit and len(decorated) > self.limit:
+            decorated = heapq.nsmallest(self.limit, decorated)
+        else:
+            decorated = sorted(decorated)
+        return [row for key, row in decorated]
+
+    def format(self, cplns):
+        return self.select(self.decorate(cplns))
+
+
+class CompletionStream(object):
+    """
+    Formats a list of CodeIntel completions in chunks.
+
+    The first chunk (in the order the backend ranked them) is formatted
+    right away so the completions can be shown without waiting for the
+    whole list; each later step formats another chunk and merges it into
+    the selection of best rows. Lists no longer than chunk_size are
+    formatted in a single step.
+
+    """
+    streams = 0
+    chunks = 0
+
+    def __init__(self, formatter, cplns, chunk_size=None):
+        self.formatter = formatter
+        self.cplns = cplns
+        self.chunk_size = chunk_size or len(cplns) or 1
+        self.offset = 0
+        self.decorated = []
+        self.selected = []  # best decorated rows so far, sorted
+        if len(cplns) > self.chunk_size:
+            CompletionStream.streams += 1
+
+    @property
+    def done(self):
+        return self.offset >= len(self.cplns)
+
+    def step(self):
+        """Format the next chunk, return whether the selected rows changed."""
+        chunk = self.cplns[self.offset:self.offset + self.chunk_size]
+        self.offset += len(chunk)
+        decorated = self.formatter.decorate(chunk)
+        self.decorated.extend(decorated)
+        CompletionStream.chunks += 1
+        if not decorated:
+            return False
+        decorated.sort()
+        limit = self.formatter.limit
+        selected = self.selected
+        if limit and len(selected) >= limit and decorated[0] >= selected[-1]:
+            return False
+        merged = heapq.merge(selected, decorated)
+        self.selected = list(itertools.islice(merged, limit)) if limit else list(merged)
+        return True
+
+    def rows(self):
+        return [row for key, row in self.selected]
+
+    def formatted(self):
+        """Return the completions formatted so far, along with their decorated rows."""
+        return self.cplns[:self.offset], self.decorated
+
+    @classmethod
+    def stats(cls):
+        return {
+            'streams': cls.streams,
+            'chunks': cls.chunks,
+        }
+
+
+class CompletionCache(object):
+    """
+    Cache of completions.
+
+    Entries are keyed by (view id, trigger position, trigger type, buffer
+    version). The latest entry of each view also serves as long as the user
+    keeps typing an identifier right after the trigger position, in which
+    case the cached completions are narrowed down by the typed prefix
+    instead of asking the backend again. The edits made since the version
+    the completions were computed for are checked through the text mirror
+    of the buffer: any edit other than typing at the cursor (new members
+    elsewhere, an undo...) makes the entry unusable.
+
+    """
+    ROW_OVERHEAD = 160  # rough per-completion memory overhead, in bytes
+
+    def __init__(self, max_size=32, max_memory=None):
+        self.cache = LRUCache(max_size, max_memory, self.weigh)
+        self.latest = {}  # map of view id -> key of the latest entry
+        self.narrowed = 0
+
+    @classmethod
+    def weigh(cls, entry):
+        return sum(cls.ROW_OVERHEAD + 2 * (len(k) + len(r[0]) + len(r[1])) for n, (k, r) in entry['rows'])
+
+    def put(self, vid, pos, type, version, cursor, line_start, line_prefix, cplns, decorated, formatter):
+        """
+        Store cplns (CodeIntel completions) for the trigger at pos, along
+        with their decorated rows and the formatter used for them. The
+        cursor position in the version of the buffer the completions were
+        computed for and the text in the line, from line_start up to pos,
+        are kept to validate the context of later lookups.
+
+        """
+        key = (vid, pos, type, version)
+        # Keep the lowercase name with each row so narrowing is a single pass:
+        names = [c[1].lstrip('$').lower() for c in cplns]
+        self.cache.set(key, {
+            'pos': pos,
+            'version': version,
+            'cursor': cursor,
+            'line_start': line_start,
+            'line_prefix': line_prefix,
+            'rows': list(zip(names, decorated)),
+            'formatter': formatter,
+        })
+        self.latest[vid] = key
+
+    def get(self, vid, pos, type, version):
+        entry = self.cache.get((vid, pos, type, version))
+        if entry is not None:
+            return entry['formatter'].select([d for n, d in entry['rows']])
+
+    def typed_since(self, entry, view, mirror):
+        """
+        Whether the only edits made since the entry's version are in the
+        text typed after the trigger position, up to the cursor.
+
+        """
+        version = entry['version']
+        change_count = getattr(view, 'change_count', None)
+        if version is None or not change_count:
+            return False
+        if change_count() == version:
+            return True
+        if mirror is None or mirror.version != change_count():
+            return False  # edits not known
+        changes = mirror.changes_since(version)
+        if changes is None:
+            return False
+        trg_pos = entry['pos']
+        end = entry['cursor']
+        for start, stop, s in changes:
+            if start < trg_pos or stop > end:
+                return False
+            end += len(s) - (stop - start)
+        return True
+
+    def narrow(self, view, mirror=None):
+        """
+        Return the cached completions (formatted) that apply at the current
+        position of the view, narrowed down by the identifier typed since
+        the trigger. Returns None if there are no usable cached completions.
+        The mirror of the view's text tells the edits made since the
+        completions were cached.
+
+        """
+        vid = view.id()
+        key = self.latest.get(vid)
+        if key is None:
+            return
+        entry = self.cache.get(key)
+        if entry is None:
+            del self.latest[vid]
+            return
+
+        view_sel = view.sel()
+        if not view_sel:
+            return
+        pos = view_sel[0].end()
+        trg_pos = entry['pos']
+        line_start = entry['line_start']
+        if pos < trg_pos or not self.typed_since(entry, view, mirror):
+            return
+        text = view.substr(sublime.Region(line_start, pos))
+        line_prefix = entry['line_prefix']
+        if not text.startswith(line_prefix):
+            return
+        typed = text[len(line_prefix):]
+        if not IDENTIFIER_RE.match(typed):
+            return
+
+        typed = typed.lstrip('$').lower()
+        self.narrowed += 1
+        if typed:
+            decorated = [d for n, d in entry['rows'] if n.startswith(typed)]
+        else:
+            decorated = [d for n, d in entry['rows']]
+        return entry['formatter'].select(decorated)
+
+    def forget(self, vid):
+        key = self.latest.pop(vid, None)
+        if key is not None:
+            self.cache.pop(key)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['narrowed'] = self.narrowed
+        return stats
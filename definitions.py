@@ -0,0 +1,62 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+
+from .cache import LRUCache
+
+
+IDENTIFIER_RE = re.compile(r'^[^\W\d][\w$]*$|^\$[\w$]+$', re.UNICODE)
+
+
+class DefinitionCache(object):
+    """
+    Cache of resolved definitions.
+
+    Entries are keyed by (view id, buffer version, identifier region), so
+    they serve wherever the cursor is within the identifier, and only for as
+    long as the buffer isn't modified. Definitions are prefetched while the
+    cursor rests on an identifier, so going to the definition can jump right
+    away instead of asking the backend.
+
+    """
+
+    def __init__(self, max_size=64):
+        self.cache = LRUCache(max_size)
+        self.prefetched = 0
+        self.jumps = 0
+
+    def key(self, view):
+        """Return the key for the identifier under the cursor, or None."""
+        view_sel = view.sel()
+        if not view_sel:
+            return
+        sel = view_sel[0]
+        if not sel.empty():
+            return
+        change_count = getattr(view, 'change_count', None)
+        if not change_count:
+            return
+        word = view.word(sel.end())
+        if word.empty() or word.size() > 256 or not IDENTIFIER_RE.match(view.substr(word)):
+            return
+        return (view.id(), change_count(), word.begin(), word.end())
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def put(self, key, defns):
+        self.prefetched += 1
+        self.cache.set(key, defns)
+
+    def get(self, key):
+        defns = self.cache.get(key)
+        if defns:
+            self.jumps += 1
+        return defns
+
+    def stats(self):
+        stats = self.cache.stats()
+        del stats['weight']
+        stats['prefetched'] = self.prefetched
+        stats['jumps'] = self.jumps
+        return stats
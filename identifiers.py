@@ -0,0 +1,229 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import time
+import heapq
+import bisect
+import threading
+from collections import Counter
+
+
+WORD_RE = re.compile(r'\b[^\W\d]\w{2,63}\b', re.UNICODE)
+WORD_CHAR_RE = re.compile(r'\w', re.UNICODE)
+
+
+class IdentifierIndex(object):
+    """
+    Index of the identifiers in the text of the open buffers, to have
+    completions right away while the backend can't give any (e.g. while
+    it's starting or busy).
+
+    Identifier counts are kept per buffer and updated from the edits made
+    to its text mirror since the last update: only the words around each
+    edit are counted again. When the edits are not known (e.g. the mirror
+    was resynced) the whole buffer is counted again, but not in the
+    caller's thread: recounts are queued and done in a background thread,
+    at most once per buffer every RECOUNT_DELAY seconds, and the buffer
+    keeps its previous counts meanwhile. Only buffers seen for the first
+    time and no larger than MAX_COLD are counted right away, as they have
+    no counts to use meanwhile. Distinct identifiers are kept in a
+    sorted array (by their lowercase form) for prefix lookups, and
+    completions are ranked by how often they appear in the current buffer,
+    then overall.
+
+    """
+    MAX_TEXT = 4 * 1024 * 1024  # characters, larger buffers aren't indexed
+    MAX_SCAN = 5000  # candidates looked at per lookup
+    LIMIT = 50
+    MAX_COLD = 64 * 1024  # characters, smaller new buffers are counted right away
+    RECOUNT_DELAY = 0.5  # seconds to wait for more edits before a recount
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.buffers = {}  # map of buffer id -> [version, text, counts]
+        self.totals = {}  # map of identifier -> count in all buffers
+        self.keys = []  # sorted list of (lowercase identifier, identifier)
+        self.pending = {}  # map of buffer id -> (version, text) to recount
+        self.counting = {}  # map of buffer id -> (version, text) being recounted
+        self.thread = None
+        self.stopped = False
+        self.full = 0
+        self.incremental = 0
+        self.lookups = 0
+
+    def _add(self, counts, word, n):
+        count = counts.get(word, 0) + n
+        if count > 0:
+            counts[word] = count
+        else:
+            counts.pop(word, None)
+        total = self.totals.get(word, 0)
+        if total + n > 0:
+            self.totals[word] = total + n
+            if not total:
+                bisect.insort(self.keys, (word.lower(), word))
+        elif total:
+            del self.totals[word]
+            key = (word.lower(), word)
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+
+    def _count(self, counts, text, n):
+        for word, count in Counter(WORD_RE.findall(text)).items():
+            self._add(counts, word, count * n)
+
+    def update(self, bid, mirror):
+        """Bring the index of the buffer up to date with its text mirror."""
+        text, version = mirror.text, mirror.version
+        if text is None:
+            return
+        with self.lock:
+            entry = self.buffers.get(bid)
+            if entry is not None and (entry[1] is text or version is not None and entry[0] == version):
+                return
+            if len(text) > self.MAX_TEXT:
+                self._forget(bid)
+                return
+            changes = mirror.changes_since(entry[0]) if entry is not None else None
+            if changes is None:
+                if entry is not None and entry[1] == text:
+                    entry[0] = version
+                    entry[1] = text
+                elif entry is None and len(text) <= self.MAX_COLD:
+                    self.pending.pop(bid, None)
+                    counts = {}
+                    self._count(counts, text, 1)
+                    self.buffers[bid] = [version, text, counts]
+                    self.full += 1
+                else:
+                    self._recount_later(bid, version, text)
+                return
+            counts = entry[2]
+            old = entry[1]
+            for i, (start, end, s) in enumerate(changes):
+                # Widen the edit to whole words on both sides:
+                left, right = start, end
+                while left > 0 and WORD_CHAR_RE.match(old[left - 1]):
+                    left -= 1
+                while right < len(old) and WORD_CHAR_RE.match(old[right]):
+                    right += 1
+                self._count(counts, old[left:right], -1)
+                self._count(counts, old[left:start] + s + old[end:right], 1)
+                if i < len(changes) - 1:
+                    old = old[:start] + s + old[end:]
+            self.incremental += 1
+            entry[0] = version
+            entry[1] = text
+
+    def _recount_later(self, bid, version, text):
+        if self.stopped:
+            return
+        self.pending[bid] = (version, text)
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='CodeIntel Identifiers')
+            self.thread.daemon = True
+            self.thread.start()
+        self.cond.notify()
+
+    def stop(self):
+        """Stop the recount thread, dropping the recounts queued."""
+        with self.cond:
+            self.stopped = True
+            self.pending = {}
+            self.counting = {}
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopped:
+                    self.cond.wait()
+                # Let bursts of edits settle, only the last text gets counted:
+                deadline = time.time() + self.RECOUNT_DELAY
+                while not self.stopped and time.time() < deadline:
+                    self.cond.wait(deadline - time.time())
+                if self.stopped:
+                    return
+                self.counting, self.pending = self.pending, {}
+            for bid, item in list(self.counting.items()):
+                counts = Counter(WORD_RE.findall(item[1]))
+                with self.lock:
+                    if self.counting.get(bid) is item:
+                        self._replace(bid, item[0], item[1], counts)
+            with self.lock:
+                self.counting = {}
+
+    def _replace(self, bid, version, text, counts):
+        """Replace the counts of the buffer and rebuild the keys."""
+        entry = self.buffers.get(bid)
+        if entry is not None and entry[0] is not None and version is not None and entry[0] >= version:
+            return  # already followed the edits past this text
+        totals = self.totals
+        if entry is not None:
+            for word, count in entry[2].items():
+                total = totals[word] - count
+                if total > 0:
+                    totals[word] = total
+                else:
+                    del totals[word]
+        for word, count in counts.items():
+            totals[word] = totals.get(word, 0) + count
+        self.buffers[bid] = [version, text, dict(counts)]
+        self.keys = sorted((word.lower(), word) for word in totals)
+        self.full += 1
+
+    def _forget(self, bid):
+        self.pending.pop(bid, None)
+        self.counting.pop(bid, None)
+        entry = self.buffers.pop(bid, None)
+        if entry is not None:
+            counts = entry[2]
+            for word, count in list(counts.items()):
+                self._add(counts, word, -count)
+
+    def forget(self, bid):
+        with self.lock:
+            self._forget(bid)
+
+    def complete(self, prefix, bid=None, limit=None):
+        """
+        Return the identifiers starting with prefix (case insensitive),
+        best ranked first.
+
+        """
+        if not prefix:
+            return []
+        lower = prefix.lower()
+        with self.lock:
+            self.lookups += 1
+            keys = self.keys
+            entry = self.buffers.get(bid)
+            local = entry[2] if entry is not None else {}
+            totals = self.totals
+            candidates = []
+            i = bisect.bisect_left(keys, (lower,))
+            end = min(len(keys), i + self.MAX_SCAN)
+            while i < end:
+                key, word = keys[i]
+                if not key.startswith(lower):
+                    break
+                if word != prefix:
+                    candidates.append((local.get(word, 0), totals[word], word))
+                i += 1
+        return [word for l, t, word in heapq.nlargest(limit or self.LIMIT, candidates)]
+
+    def completions(self, prefix, bid=None, limit=None):
+        """Return the completions rows for the identifiers starting with prefix."""
+        return [("%s\t〔Identifier〕" % word, word) for word in self.complete(prefix, bid, limit)]
+
+    def stats(self):
+        return {
+            'buffers': len(self.buffers),
+            'pending': len(self.pending),
+            'identifiers': len(self.keys),
+            'full': self.full,
+            'incremental': self.incremental,
+            'lookups': self.lookups,
+        }
@@ -0,0 +1,422 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import stat
+import time
+import heapq
+import logging
+import threading
+
+from .manifest import Manifest
+from .pathmatch import PathMatcher
+
+logger = logging.getLogger('CodeIntel.indexer')
+
+
+# Default file extension to language map, extended with what's learned from
+# the views (which have the syntax the user actually picked):
+EXTENSIONS = {
+    '.py': 'Python', '.pyw': 'Python',
+    '.js': 'ECMAScript', '.jsx': 'ECMAScript', '.mjs': 'ECMAScript',
+    '.php': 'PHP', '.inc': 'PHP',
+    '.rb': 'Ruby',
+    '.pl': 'Perl', '.pm': 'Perl',
+    '.tcl': 'Tcl',
+    '.go': 'Go',
+    '.css': 'CSS', '.less': 'Less', '.scss': 'SCSS',
+    '.html': 'HTML', '.htm': 'HTML',
+    '.xml': 'XML', '.xul': 'XUL', '.xbl': 'XBL',
+}
+
+
+def decode(content):
+    """Decode the content of a file (UTF-8, or Latin-1 when it isn't)."""
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('latin-1')
+
+
+class ScanHandler(object):
+    """Handler for a single scan-document request issued by the indexer."""
+
+    def __init__(self, indexer, path):
+        self.indexer = indexer
+        self.path = path
+
+    def on_document_scanned(self, buf):
+        self.indexer.done(self.path, True)
+
+    def set_status_message(self, buf, msg, *args):
+        logger.debug("Cannot index %s: %s", self.path, msg)
+        self.indexer.done(self.path, False)
+
+
+class Indexer(object):
+    """
+    Background pre-indexing of the project files.
+
+    A worker thread walks the project folders (and the extra scan paths),
+    skipping excluded directories and going no deeper than max_depth, and
+    hands every file of a known language to the backend to be scanned.
+    What was indexed is recorded in a manifest kept across sessions, so
+    directories that didn't change are not listed again and only new or
+    modified files are scanned. The manifest is tied to the backend database
+    (see configure()): when the database changes, everything is indexed
+    again.
+    Files open in the views go first, then files modified recently, then
+    everything else. Only a few scans are kept in flight at a time, and the
+    worker pauses while the user is interacting (triggers, completions...)
+    so it never competes with interactive requests.
+
+    The scan function is called as scan(path, lang, text, handler), with
+    the content read from disk (the backend keeps the buffers of the paths
+    it knows, so it must always be given the current content); the handler
+    must be used for the backend scan-document request. If given, watch is
+    called with every directory walked, so it can be watched for changes
+    (which are then passed back through rescan()). Indexed files found to
+    be deleted are dropped from the manifest and, if given, passed to
+    purge(path, lang, handler) so the backend forgets them too.
+
+    """
+    PRIORITY_OPEN = 0
+    PRIORITY_DIRECTORY = 1
+    PRIORITY_RECENT = 2
+    PRIORITY_PROJECT = 3
+
+    RECENT = 24 * 60 * 60  # seconds since a file modification to be "recent"
+    MAX_IN_FLIGHT = 4
+    SCAN_TIMEOUT = 30.0  # seconds to wait for a scan to complete
+    YIELD = 0.5  # seconds to stay idle after interactive requests
+    SAVE_INTERVAL = 30.0  # seconds between saves of the manifest while busy
+
+    def __init__(self, scan, watch=None, purge=None):
+        self.scan = scan
+        self.watch = watch
+        self.purge = purge
+        self.cond = threading.Condition()
+        self.queue = []  # heap of (priority, sequence, path, depth)
+        self.sequence = 0
+        self.queued = set()
+        self.in_flight = {}  # map of path -> (time sent, size, mtime, hash)
+        self.manifest = Manifest()
+        self.manifest_path = None
+        self.database = None
+        self.roots = set()
+        self.open_files = set()
+        self.extensions = dict(EXTENSIONS)
+        self.languages = set()
+        self.exclude = PathMatcher()
+        self.max_depth = 10
+        self.interacted = 0
+        self.thread = None
+        self.stopped = False
+        self.enabled = False
+        self.walked = 0
+        self.scanned = 0
+        self.unchanged = 0
+        self.listed = 0
+        self.rescans = 0
+        self.failed = 0
+        self.purged = 0
+        self.busy_time = 0.0  # seconds spent with work pending
+        self.busy_since = None
+
+    def configure(self, enabled=None, exclude=None, max_depth=None, languages=None, manifest=None, database=None):
+        """
+        Change the given settings of the indexer (None leaves them as they
+        are). The database is a key identifying the backend database files
+        get indexed into.
+
+        """
+        with self.cond:
+            if enabled is not None:
+                self.enabled = enabled
+                if not enabled:
+                    del self.queue[:]
+                    self.queued.clear()
+            if exclude is not None:
+                self.exclude = exclude
+            if max_depth is not None:
+                self.max_depth = max_depth
+            if languages is not None:
+                self.languages = set(languages)
+            if manifest is not None:
+                self.manifest_path = manifest
+            if database is not None and database != self.database:
+                self.database = database
+                # Walk the roots again, with the manifest of the new database:
+                for root in self.roots:
+                    self._push(self.PRIORITY_DIRECTORY, root, 0)
+            self.cond.notify()
+
+    def learn(self, path, lang):
+        """Map the extension of path to the language of a view."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext and self.extensions.get(ext) != lang:
+            self.extensions[ext] = lang
+
+    def interact(self):
+        """Let the indexer know the user is waiting for a request."""
+        self.interacted = time.time()
+
+    def index(self, roots, open_files=()):
+        """
+        Queue the new roots to be indexed (and the open files, which go
+        first). Roots already indexed are not walked again.
+
+        """
+        with self.cond:
+            if not self.enabled:
+                return
+            self.open_files = set(open_files)
+            for path in open_files:
+                self._push(self.PRIORITY_OPEN, path, None)
+            for root in roots:
+                if root and root not in self.roots:
+                    self.roots.add(root)
+                    self._push(self.PRIORITY_DIRECTORY, root, 0)
+            self.cond.notify()
+        self.start()
+
+    def rescan(self, paths, deleted=()):
+        """
+        Queue changed files and new directories to be indexed again, or all
+        the roots if paths is None. Open files go first. Deleted files and
+        directories are purged.
+
+        """
+        items = []
+        if paths is not None:
+            roots = tuple(self.roots)
+            for path in paths:
+                if os.path.isdir(path):
+                    # Depth of the directory under the closest root containing it:
+                    depths = [path[len(r):].count(os.sep) for r in roots if path.startswith(r + os.sep)]
+                    if depths:
+                        items.append((self.PRIORITY_DIRECTORY, path, min(depths)))
+                else:
+                    items.append((self.PRIORITY_OPEN if path in self.open_files else self.PRIORITY_RECENT, path, None))
+        with self.cond:
+            if not self.enabled:
+                return
+            if paths is None:
+                items = [(self.PRIORITY_DIRECTORY, root, 0) for root in self.roots]
+            for priority, path, depth in items:
+                self._push(priority, path, depth)
+            self.rescans += 1
+            self.cond.notify()
+        for path in deleted:
+            self._purge(path)
+
+    def _purge(self, path):
+        """Forget a deleted file or directory, and the indexed files in it."""
+        for file_path in self.manifest.forget(path):
+            lang = self.extensions.get(os.path.splitext(file_path)[1].lower())
+            if self.purge and lang in self.languages:
+                self.purge(file_path, lang, ScanHandler(self, file_path))
+            with self.cond:
+                self.purged += 1
+
+    def forget(self):
+        """Forget the indexed roots so they are walked again."""
+        with self.cond:
+            self.roots.clear()
+
+    def start(self):
+        if self.stopped:
+            return
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='CodeIntel Indexer')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread is None or not self.thread.is_alive():
+            self.manifest.save()
+
+    def _push(self, priority, path, depth):
+        if path in self.queued:
+            return
+        self.queued.add(path)
+        self.sequence += 1
+        heapq.heappush(self.queue, (priority, self.sequence, path, depth))
+        if self.busy_since is None:
+            self.busy_since = time.time()
+
+    def _pop(self):
+        """
+        Wait for the next item to work on, returns (path, depth), (None,
+        None) when it's time to save the manifest, or None when stopped.
+
+        """
+        with self.cond:
+            while not self.stopped:
+                now = time.time()
+                for path, entry in list(self.in_flight.items()):
+                    if entry[0] < now - self.SCAN_TIMEOUT:
+                        del self.in_flight[path]
+                        self.failed += 1
+                idle = self.interacted + self.YIELD - now
+                if not self.queue or not self.enabled:
+                    if not self.in_flight:
+                        if self.busy_since is not None:
+                            self.busy_time += now - self.busy_since
+                            self.busy_since = None
+                        if self.manifest.dirty:
+                            return None, None
+                    self.cond.wait()
+                elif idle > 0:
+                    self.cond.wait(idle)
+                elif len(self.in_flight) >= self.MAX_IN_FLIGHT and self.queue[0][3] is None:
+                    self.cond.wait(1)
+                else:
+                    priority, sequence, path, depth = heapq.heappop(self.queue)
+                    self.queued.discard(path)
+                    return path, depth
+
+    def run(self):
+        while True:
+            item = self._pop()
+            if item is None:
+                break
+            manifest = self.manifest
+            if self.manifest_path and (manifest.path, manifest.key) != (self.manifest_path, self.database):
+                if manifest.path == self.manifest_path:
+                    logger.info("CodeIntel database changed, indexing everything again")
+                manifest.load(self.manifest_path, self.database)
+            path, depth = item
+            try:
+                if path is None:
+                    self.manifest.save()
+                elif depth is None:
+                    self._scan(path)
+                else:
+                    self._walk(path, depth)
+            except Exception:
+                logger.exception("Error indexing %s", path)
+            if self.manifest.dirty and self.manifest.saved < time.time() - self.SAVE_INTERVAL:
+                self.manifest.save()
+        self.manifest.save()
+
+    def _walk(self, directory, depth):
+        if self.exclude.excluded(directory):
+            return
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return
+        manifest = self.manifest
+        listing = manifest.listing(directory, mtime)
+        if listing is None:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                return
+            dirs = []
+            files = []
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    dirs.append(name)
+                else:
+                    files.append(name)
+            removed = manifest.set_listing(directory, mtime, dirs, files)
+            self.listed += 1
+            for name in removed:
+                self._purge(os.path.join(directory, name))
+        else:
+            dirs, files = listing
+        if self.watch:
+            self.watch(directory)
+
+        recent = time.time() - self.RECENT
+        extensions = self.extensions
+        languages = self.languages
+        items = []
+        if depth < self.max_depth:
+            for name in dirs:
+                items.append((self.PRIORITY_DIRECTORY, os.path.join(directory, name), depth + 1))
+        unchanged = 0
+        for name in files:
+            if extensions.get(os.path.splitext(name)[1].lower()) not in languages:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if not manifest.changed(path, st.st_size, st.st_mtime):
+                unchanged += 1
+                continue
+            items.append((self.PRIORITY_RECENT if st.st_mtime > recent else self.PRIORITY_PROJECT, path, None))
+        with self.cond:
+            self.walked += 1
+            self.unchanged += unchanged
+            for priority, path, depth in items:
+                self._push(priority, path, depth)
+            self.cond.notify()
+
+    def _scan(self, path):
+        lang = self.extensions.get(os.path.splitext(path)[1].lower())
+        if lang not in self.languages or self.exclude.excluded(path):
+            return
+        try:
+            st = os.stat(path)
+            content = None
+            if self.manifest.changed(path, st.st_size, st.st_mtime):
+                with open(path, 'rb') as f:
+                    content = f.read()
+        except (IOError, OSError):
+            return
+        # Size or mtime changes don't always mean the content changed:
+        digest = content is not None and self.manifest.hash(content)
+        if not digest or self.manifest.same_content(path, digest):
+            if digest:
+                self.manifest.update(path, st.st_size, st.st_mtime, digest)
+            with self.cond:
+                self.unchanged += 1
+            return
+        with self.cond:
+            self.in_flight[path] = (time.time(), st.st_size, st.st_mtime, digest)
+        self.scan(path, lang, decode(content), ScanHandler(self, path))
+
+    def done(self, path, success):
+        with self.cond:
+            entry = self.in_flight.pop(path, None)
+            if entry is None:
+                return
+            if success:
+                self.scanned += 1
+                self.manifest.update(path, *entry[1:])
+            else:
+                self.failed += 1
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            busy_time = self.busy_time
+            if self.busy_since is not None:
+                busy_time += time.time() - self.busy_since
+            return {
+                'roots': len(self.roots),
+                'queued': len(self.queue),
+                'in_flight': len(self.in_flight),
+                'walked': self.walked,
+                'listed': self.listed,
+                'rescans': self.rescans,
+                'scanned': self.scanned,
+                'unchanged': self.unchanged,
+                'failed': self.failed,
+                'purged': self.purged,
+                'manifest_files': len(self.manifest.files),
+                'files_per_second': round(self.scanned / busy_time, 2) if busy_time else 0,
+            }
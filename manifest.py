@@ -0,0 +1,150 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('CodeIntel.manifest')
+
+
+class Manifest(object):
+    """
+    On disk record of what has already been indexed.
+
+    For every directory it keeps its mtime and listing (sub-directories and
+    files), so the listing of a directory that didn't change is not read
+    again. For every file it keeps (size, mtime, content hash) as of its
+    last successful scan: files with the same size and mtime are taken as
+    unchanged, and the hash is only computed (and compared) when those
+    differ.
+
+    A manifest is only valid for the database the files were indexed into,
+    identified by a key; records saved with a different key are dropped
+    when loaded.
+
+    """
+    VERSION = 1
+
+    def __init__(self, path=None, key=None):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+        self.dirs = {}  # map of directory -> [mtime, dirs, files]
+        self.files = {}  # map of path -> [size, mtime, hash]
+        self.dirty = False
+        self.saved = time.time()
+
+    def load(self, path, key=None):
+        """Load the manifest for key from path (which is also where it'll be saved)."""
+        data = None
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError):
+            pass
+        except ValueError as e:
+            logger.warning("Ignoring corrupt manifest %r: %s", path, e)
+        with self.lock:
+            self.path = path
+            self.key = key
+            valid = bool(data) and data.get('version') == self.VERSION and data.get('key') == key
+            if valid:
+                self.dirs = data.get('dirs', {})
+                self.files = data.get('files', {})
+            else:
+                self.dirs = {}
+                self.files = {}
+            self.dirty = not valid
+
+    def save(self):
+        with self.lock:
+            if not self.path or not self.dirty:
+                return
+            data = json.dumps({
+                'version': self.VERSION,
+                'key': self.key,
+                'dirs': self.dirs,
+                'files': self.files,
+            }, separators=(',', ':'))
+            path = self.path
+            self.dirty = False
+            self.saved = time.time()
+        tmp = path + '.tmp'
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with io.open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            if os.path.exists(path):
+                os.remove(path)  # rename doesn't overwrite on Windows
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            logger.warning("Cannot save manifest %r: %s", path, e)
+
+    def clear(self):
+        with self.lock:
+            self.dirs = {}
+            self.files = {}
+            self.dirty = True
+
+    def listing(self, directory, mtime):
+        """Return the recorded (dirs, files) of directory, if its mtime didn't change."""
+        with self.lock:
+            entry = self.dirs.get(directory)
+        if entry and entry[0] == mtime:
+            return entry[1], entry[2]
+
+    def set_listing(self, directory, mtime, dirs, files):
+        """Record the listing of directory, returns the names no longer in it."""
+        with self.lock:
+            entry = self.dirs.get(directory)
+            self.dirs[directory] = [mtime, dirs, files]
+            self.dirty = True
+        if not entry:
+            return []
+        names = set(dirs)
+        names.update(files)
+        return [name for name in entry[1] + entry[2] if name not in names]
+
+    def forget(self, path):
+        """
+        Forget a file, or a directory and everything under it. Returns the
+        files that were forgotten.
+
+        """
+        prefix = path + os.sep
+        with self.lock:
+            files = [f for f in self.files if f == path or f.startswith(prefix)]
+            for f in files:
+                del self.files[f]
+            dirs = [d for d in self.dirs if d == path or d.startswith(prefix)]
+            for d in dirs:
+                del self.dirs[d]
+            if files or dirs:
+                self.dirty = True
+        return files
+
+    def changed(self, path, size, mtime):
+        """Whether the file changed (size or mtime) since it was last indexed."""
+        with self.lock:
+            entry = self.files.get(path)
+        return not entry or entry[0] != size or entry[1] != mtime
+
+    def hash(self, content):
+        """Return the hash of the content of a file."""
+        return hashlib.sha1(content).hexdigest()
+
+    def same_content(self, path, digest):
+        with self.lock:
+            entry = self.files.get(path)
+        return bool(entry) and entry[2] == digest
+
+    def update(self, path, size, mtime, digest):
+        with self.lock:
+            self.files[path] = [size, mtime, digest]
+            self.dirty = True
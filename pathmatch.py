@@ -0,0 +1,115 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import re
+import fnmatch
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+class Node(object):
+    __slots__ = ('children', 'globs', 'terminal')
+
+    def __init__(self):
+        self.children = {}  # map of segment -> Node
+        self.globs = []  # list of (glob, match, Node) for glob segments
+        self.terminal = False
+
+    def add(self, segments):
+        node = self
+        for segment in segments:
+            if GLOB_CHARS.search(segment):
+                for glob, match, child in node.globs:
+                    if glob == segment:
+                        break
+                else:
+                    child = Node()
+                    node.globs.append((segment, re.compile(fnmatch.translate(segment)).match, child))
+            else:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = Node()
+            node = child
+        node.terminal = True
+
+    def match(self, segments, start):
+        """Whether a pattern in the trie matches the segments from start on."""
+        nodes = [self]
+        for segment in segments[start:]:
+            following = []
+            for node in nodes:
+                child = node.children.get(segment)
+                if child is not None:
+                    if child.terminal:
+                        return True
+                    following.append(child)
+                for glob, match, child in node.globs:
+                    if match(segment):
+                        if child.terminal:
+                            return True
+                        following.append(child)
+            if not following:
+                return False
+            nodes = following
+        return False
+
+
+class PathMatcher(object):
+    """
+    Compiled set of path patterns, to exclude paths from scans.
+
+    Patterns are split in path segments and kept in two tries, so a path is
+    checked against all the patterns in a single pass over its segments:
+
+    - Prefix patterns, absolute paths with more than one segment and no
+      trailing separator (e.g. "~/src/project/vendor"), match the path and
+      everything under it.
+    - Segment patterns, everything else (e.g. "/build/", "node_modules" or
+      "/static/min/"), match the segments anywhere in the path.
+
+    Segments can be globs (e.g. "*.egg-info" or "/build*/").
+
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = []
+        self.anchored = Node()
+        self.floating = Node()
+        self.empty = True
+        for pattern in patterns:
+            self.add(pattern)
+
+    @staticmethod
+    def split(path):
+        path = os.path.normcase(os.path.normpath(path))
+        return [s for s in path.split(os.sep) if s]
+
+    def add(self, pattern):
+        if not pattern:
+            return
+        pattern = os.path.expanduser(pattern.strip()).replace('/', os.sep)
+        segments = self.split(pattern)
+        if not segments:
+            return
+        if os.path.isabs(pattern) and not pattern.endswith(os.sep) and len(segments) > 1:
+            self.anchored.add(segments)
+        else:
+            self.floating.add(segments)
+        self.patterns.append(pattern)
+        self.empty = False
+
+    def excluded(self, path):
+        """Whether the path (a file or a directory) is excluded."""
+        if self.empty:
+            return False
+        segments = self.split(path)
+        if self.anchored.match(segments, 0):
+            return True
+        floating = self.floating
+        if floating.globs:
+            return any(floating.match(segments, i) for i in range(len(segments)))
+        children = floating.children
+        return any(segment in children and floating.match(segments, i) for i, segment in enumerate(segments))
+
+    def __len__(self):
+        return len(self.patterns)
@@ -0,0 +1,204 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+import logging
+import weakref
+import threading
+
+import sublime
+
+logger = logging.getLogger('CodeIntel.pool')
+
+
+class CodeIntelPool(object):
+    """
+    Pool of CodeIntel backends, each one its own process with its own
+    prefs and request queue, so requests in different languages can run in
+    parallel.
+
+    Languages are sharded by groups: every group gets a worker, started
+    lazily the first time one of its languages is used. Workers are
+    started in background threads, and their languages get no backend
+    until they are ready. Languages not in any group, and every language
+    when the pool is disabled, go to the primary backend; so do the groups
+    of workers that couldn't be started. Once `size` processes (including
+    the primary) are running, new groups go to the least loaded one.
+    Workers idle for more than `idle_timeout` seconds are shut down (and
+    started again when needed).
+
+    """
+    REAP_INTERVAL = 60000  # milliseconds
+
+    def __init__(self, primary, factory, ready=None):
+        self.primary = primary
+        self.factory = factory  # returns a new (inactive) CodeIntel
+        self.ready = ready  # returns whether an active CodeIntel is ready
+        self.enabled = False
+        self.size = 2
+        self.idle_timeout = 600
+        self.groups = {}  # map of lang -> group name
+        self.activation = {}  # CodeIntel.activate() keyword arguments (but prefs)
+        self.prefs_for = None  # returns the prefs for a list of languages
+        self.workers = {}  # map of group name -> CodeIntel
+        self.used = {}  # map of CodeIntel id -> last time used
+        self.activating = set()  # ids of the workers being activated
+        self.broken = set()  # ids of the workers that couldn't be activated
+        self.observers = weakref.WeakSet()
+        self.reaping = False
+        self.started = 0
+        self.reaped = 0
+
+    def configure(self, enabled=False, size=2, idle_timeout=600, groups=(), activation=None, prefs_for=None):
+        """
+        Configure the pool. groups is a list of lists of languages, which
+        are named after their first language.
+
+        """
+        self.enabled = enabled
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.groups = {}
+        for group in groups:
+            if isinstance(group, (list, tuple)) and group:
+                for lang in group:
+                    self.groups[lang] = group[0]
+            elif group:
+                self.groups[group] = group
+        self.activation = activation or {}
+        self.prefs_for = prefs_for
+
+        for group, worker in list(self.workers.items()):
+            if not enabled or group not in self.groups.values():
+                self.stop(group)
+            elif worker is not self.primary and worker.enabled:
+                langs = self.languages(group)
+                worker.mgr.set_global_environment(env=self.activation.get('env'), prefs=self.prefs_for(langs))
+
+    def languages(self, group):
+        return sorted(lang for lang, g in self.groups.items() if g == group)
+
+    def add_observer(self, obj):
+        self.observers.add(obj)
+        self.primary.add_observer(obj)
+        for worker in self.workers.values():
+            worker.add_observer(obj)
+
+    def load(self, worker):
+        """Load of a backend: groups assigned and requests pending."""
+        mgr = worker.mgr
+        return sum(1 for w in self.workers.values() if w is worker) + (len(mgr.requests) if mgr else 0)
+
+    def service(self, lang):
+        """
+        Return the CodeIntel backend serving the language, or None while its
+        worker is starting.
+
+        """
+        group = self.groups.get(lang) if self.enabled else None
+        if group is None:
+            return self.primary
+
+        worker = self.workers.get(group)
+        if worker is not None and id(worker) in self.broken:
+            self.broken.discard(id(worker))
+            worker = self.workers[group] = self.primary
+        if worker is None:
+            running = set(id(w) for w in self.workers.values())
+            running.add(id(self.primary))
+            if len(running) < self.size:
+                worker = self.start(group)
+            else:
+                # Out of processes, share the least loaded one:
+                candidates = [self.primary] + [w for w in self.workers.values() if w is not self.primary]
+                worker = min(candidates, key=self.load)
+            self.workers[group] = worker
+        elif worker is not self.primary and not worker.enabled and id(worker) not in self.activating:
+            self.activate(worker, group)
+        self.used[id(worker)] = time.time()
+        if worker is not self.primary and not self.is_ready(worker):
+            return None
+        return worker
+
+    def is_ready(self, worker):
+        if id(worker) in self.activating or not worker.enabled:
+            return False
+        return self.ready(worker) if self.ready else True
+
+    def start(self, group):
+        worker = self.factory()
+        worker.languages.update(self.primary.languages)
+        for obj in self.observers:
+            worker.add_observer(obj)
+        self.activate(worker, group)
+        self.started += 1
+        return worker
+
+    def activate(self, worker, group):
+        """Activate the worker in a background thread, spawning it can take a while."""
+        langs = self.languages(group)
+        logger.info("Starting CodeIntel worker for %s", ", ".join(langs))
+        kwargs = dict(self.activation)
+        kwargs['prefs'] = self.prefs_for(langs) if self.prefs_for else None
+        self.activating.add(id(worker))
+
+        def _activate():
+            try:
+                worker.activate(reset_db_as_necessary=False, **kwargs)
+            except Exception:
+                logger.exception("Error starting CodeIntel worker for %s", ", ".join(langs))
+                self.broken.add(id(worker))
+            finally:
+                self.activating.discard(id(worker))
+
+        thread = threading.Thread(target=_activate, name='CodeIntel Pool Activation')
+        thread.daemon = True
+        thread.start()
+
+        # Every activated worker has to be reaped once idle:
+        if not self.reaping:
+            self.reaping = True
+            sublime.set_timeout(self.reap, self.REAP_INTERVAL)
+
+    def stop(self, group):
+        worker = self.workers.pop(group, None)
+        if worker is None or worker is self.primary:
+            return
+        if any(w is worker for w in self.workers.values()):
+            return  # still serving other groups
+        self.used.pop(id(worker), None)
+        worker.deactivate()
+
+    def reap(self):
+        """Shut down the workers idle for too long."""
+        now = time.time()
+        for group, worker in list(self.workers.items()):
+            if worker is not self.primary and worker.enabled and id(worker) not in self.activating and self.used.get(id(worker), 0) < now - self.idle_timeout:
+                logger.info("Stopping idle CodeIntel worker for %s", ", ".join(self.languages(group)))
+                worker.deactivate()
+                self.reaped += 1
+        self.reaping = any(w is not self.primary and (w.enabled or id(w) in self.activating) for w in self.workers.values())
+        if self.reaping:
+            sublime.set_timeout(self.reap, self.REAP_INTERVAL)
+
+    def shutdown(self):
+        for group in list(self.workers):
+            self.stop(group)
+
+    def stats(self):
+        now = time.time()
+        stats = {
+            'enabled': self.enabled,
+            'started': self.started,
+            'reaped': self.reaped,
+        }
+        for group, worker in sorted(self.workers.items()):
+            mgr = worker.mgr
+            if worker is self.primary:
+                state = 'primary'
+            elif id(worker) in self.activating:
+                state = 'starting'
+            else:
+                state = 'running' if worker.enabled else 'idle'
+            stats['worker %s' % group] = "%s, %d pending, used %ds ago" % (
+                state, len(mgr.requests) if mgr else 0, now - self.used.get(id(worker), now))
+        return stats
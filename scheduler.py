@@ -0,0 +1,82 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import threading
+
+import sublime
+
+
+class TriggerScheduler(object):
+    """
+    Coalesces bursts of triggers per view.
+
+    Every scheduled trigger gets a new generation number for its view and
+    only runs if no newer trigger was scheduled for that view before its
+    delay expires. Results of requests whose generation is no longer the
+    current one are stale and get dropped instead of rendered.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generations = {}  # map of view id -> current generation
+        self.requested = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.stale = 0
+        self.served = 0
+
+    def bump(self, vid):
+        """Start a new generation for the view and return it."""
+        with self.lock:
+            generation = self.generations.get(vid, 0) + 1
+            self.generations[vid] = generation
+            self.requested += 1
+        return generation
+
+    def is_current(self, vid, generation):
+        return self.generations.get(vid) == generation
+
+    def schedule(self, vid, callback, delay=0):
+        """
+        Call callback(generation) after delay milliseconds, unless another
+        trigger is scheduled for the same view in the meantime.
+
+        """
+        generation = self.bump(vid)
+
+        def _run():
+            if not self.is_current(vid, generation):
+                with self.lock:
+                    self.coalesced += 1
+                return
+            callback(generation)
+        sublime.set_timeout(_run, delay or 0)
+        return generation
+
+    def forget(self, vid):
+        self.generations.pop(vid, None)
+
+    def cancel(self):
+        """Count a request aborted before reaching the next stage."""
+        with self.lock:
+            self.cancelled += 1
+
+    def drop(self):
+        """Count a result that arrived for a superseded request."""
+        with self.lock:
+            self.stale += 1
+
+    def serve(self):
+        """Count a result that was delivered."""
+        with self.lock:
+            self.served += 1
+
+    def stats(self):
+        return {
+            'requested': self.requested,
+            'coalesced': self.coalesced,
+            'cancelled': self.cancelled,
+            'stale': self.stale,
+            'dropped': self.coalesced + self.cancelled + self.stale,
+            'served': self.served,
+        }
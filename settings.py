@@ -2,26 +2,94 @@ from __future__ import absolute_import, unicode_literals, print_function
 
 import os
 import json
-from copy import deepcopy
 from collections import defaultdict
 
 import sublime
 import sublime_plugin
 
 
+MISSING = object()
+
+
+class SettingsSnapshot(object):
+    """
+    Immutable, versioned snapshot of the plugin settings.
+
+    Changing a setting makes a new snapshot sharing all other values with
+    the previous one (snapshots, and the values in them, are never modified
+    in place). Per-language lookup tables, the settings with the overrides
+    of each language applied, are computed once per snapshot, so getting a
+    setting is a single dict lookup.
+
+    """
+    __slots__ = ('data', 'version', 'languages_key', 'tables')
+
+    def __init__(self, data, version=0, languages_key=None):
+        self.data = data
+        self.version = version
+        self.languages_key = languages_key
+        self.tables = {}  # map of language -> settings with its overrides applied
+        languages = data.get(languages_key) if languages_key else None
+        if isinstance(languages, dict):
+            for lang, overrides in languages.items():
+                if isinstance(overrides, dict) and overrides:
+                    table = dict(data)
+                    table.update(overrides)
+                    self.tables[lang] = table
+
+    def get(self, setting, default=None, lang=None):
+        return self.tables.get(lang, self.data).get(setting, default)
+
+    def replace(self, setting, value=MISSING):
+        """Return a new snapshot with the setting set to value (or removed)."""
+        data = dict(self.data)
+        if value is MISSING:
+            data.pop(setting, None)
+        else:
+            data[setting] = value
+        return SettingsSnapshot(data, self.version + 1, self.languages_key)
+
+    def diff(self, other):
+        """Return the set of settings that differ from the other snapshot."""
+        data, other_data = self.data, other.data
+        changed = set()
+        for setting in set(data) | set(other_data):
+            value = data.get(setting, MISSING)
+            other_value = other_data.get(setting, MISSING)
+            if value is not other_value and value != other_value:
+                changed.add(setting)
+        return changed
+
+
 class Settings(object):
     """This class provides global access to and management of plugin settings."""
     nested_settings = ()
+    languages_key = None  # setting with the per-language overrides (if any)
 
     def __init__(self, name):
         """Initialize a new instance."""
         self.name = name
-        self.settings = {}
-        self.previous_settings = {}
+        self.snapshot = SettingsSnapshot({}, 0, self.languages_key)
+        self.previous = self.snapshot
+        self.changed = set()
         self.changeset = set()
         self.plugin_settings = None
         self.edits = defaultdict(list)
 
+    @property
+    def settings(self):
+        """The current settings (which should never be modified in place)."""
+        return self.snapshot.data
+
+    @property
+    def previous_settings(self):
+        """The settings as of the last update."""
+        return self.previous.data
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
     def load(self, force=False):
         """Load the plugin settings."""
         if force or not self.settings:
@@ -34,7 +102,7 @@ class Settings(object):
 
     def get(self, setting, default=None):
         """Return a plugin setting, defaulting to default if not found."""
-        return self.settings.get(setting, default)
+        return self.snapshot.data.get(setting, default)
 
     def set(self, setting, value, changed=False):
         """
@@ -47,8 +115,7 @@ class Settings(object):
         they should pass changed=True.
 
         """
-        self.copy()
-        self.settings[setting] = value
+        self.snapshot = self.snapshot.replace(setting, value)
 
         if changed:
             self.changeset.add(setting)
@@ -61,12 +128,9 @@ class Settings(object):
         instead of doing settings.pop('foo').
 
         """
-        self.copy()
-        return self.settings.pop(setting, default)
-
-    def copy(self):
-        """Save a copy of the plugin settings."""
-        self.previous_settings = deepcopy(self.settings)
+        value = self.snapshot.data.get(setting, default)
+        self.snapshot = self.snapshot.replace(setting)
+        return value
 
     def observe(self, observer=None):
         """Observer changes to the plugin settings."""
@@ -101,16 +165,24 @@ class Settings(object):
         return default
 
     def on_change(self):
-        """Update state when the user settings change."""
+        """
+        Update state when the user settings change. The settings that
+        changed since the last update are in self.changed while on_update
+        runs.
+
+        """
 
         settings = self.merge_user_settings(self.plugin_settings)
-        self.settings.clear()
-        self.settings.update(settings)
+        self.snapshot = SettingsSnapshot(settings, self.snapshot.version + 1, self.languages_key)
+        self.changed = self.snapshot.diff(self.previous) | self.changeset
 
-        self.on_update()
+        # Settings files are reloaded (and this called) even when nothing
+        # changed in them, there's nothing to update then:
+        if self.changed or not self.previous.version:
+            self.on_update()
 
         self.changeset.clear()
-        self.copy()
+        self.previous = self.snapshot
 
     def on_update(self):
         """To be implemented by the user, when needed."""
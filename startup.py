@@ -0,0 +1,110 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import sublime
+
+timer = getattr(time, 'perf_counter', time.time)
+
+logger = logging.getLogger('CodeIntel.startup')
+
+
+class Startup(object):
+    """
+    Readiness of the CodeIntel backend and timing of the startup.
+
+    Activation (spawning the backend process and pushing the environment)
+    runs in a background thread; the UI thread only polls, with a cheap
+    check, until the backend is ready (or failed) and then calls on_ready.
+    Milestones are recorded in seconds since the plugin was loaded, along
+    with the time the UI thread spent in startup work.
+
+    """
+    POLL = 100  # milliseconds
+
+    INACTIVE = 'inactive'
+    STARTING = 'starting'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self):
+        self.state = self.INACTIVE
+        self.started = time.time()
+        self.milestones = OrderedDict()  # map of milestone -> seconds since started
+        self.blocked = 0.0  # milliseconds spent in the UI thread
+        self.generation = 0
+        self.prewarmed = ()
+
+    @property
+    def ready(self):
+        return self.state == self.READY
+
+    def mark(self, milestone):
+        self.milestones[milestone] = time.time() - self.started
+
+    def block(self, fn, *args, **kwargs):
+        """Call fn in the UI thread, accounting for the time spent."""
+        start = timer()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.blocked += (timer() - start) * 1000.0
+
+    def activate(self, activate, check, on_ready):
+        """
+        Run activate() in a background thread, then poll check() until it
+        returns READY or FAILED (None while still starting). on_ready() is
+        called in the UI thread once the backend is ready.
+
+        """
+        self.generation += 1
+        generation = self.generation
+        self.state = self.STARTING
+        self.mark('activate')
+
+        def _activate():
+            try:
+                activate()
+            except Exception:
+                logger.exception("Error activating CodeIntel")
+                self.state = self.FAILED
+                return
+            self.mark('activated')
+            sublime.set_timeout(_poll, 0)
+
+        def _poll():
+            if generation != self.generation or self.state != self.STARTING:
+                return
+            state = check()
+            if state == self.READY:
+                self.state = self.READY
+                self.mark('ready')
+                self.block(on_ready)
+            elif state == self.FAILED:
+                self.state = self.FAILED
+                self.mark('failed')
+            else:
+                sublime.set_timeout(_poll, self.POLL)
+
+        thread = threading.Thread(target=_activate, name='CodeIntel Activation')
+        thread.daemon = True
+        thread.start()
+
+    def run(self, fn):
+        """Run fn() in a background thread (e.g. to deactivate the backend)."""
+        thread = threading.Thread(target=fn, name='CodeIntel Activation')
+        thread.daemon = True
+        thread.start()
+
+    def stats(self):
+        stats = {
+            'state': self.state,
+            'ui_blocked_ms': round(self.blocked, 2),
+            'prewarmed': ', '.join(self.prewarmed) or None,
+        }
+        for milestone, seconds in self.milestones.items():
+            stats['%s_s' % milestone] = round(seconds, 3)
+        return stats
@@ -0,0 +1,215 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import math
+import time
+import threading
+from collections import deque
+
+import sublime
+
+
+class StatusQueue(object):
+    """
+    Status bar messages for all views, drained by a single timer.
+
+    Only the latest message posted for a given (view, status id) is kept,
+    and showing and erasing messages happens in one pass per tick, so
+    status traffic costs at most one UI callback per tick no matter how
+    many messages are posted. The timer only ticks when the next message is
+    due to be shown or erased, and stops while there is nothing left to
+    show or erase.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # map of (view id, lid) -> (view, text, show at, expire at, log)
+        self.shown = {}  # map of (view id, lid) -> (view, text, expire at)
+        self.next_tick = None  # time the timer is set to tick at
+        self.timer = 0  # id of the timer set, older timers are ignored
+        self.posted = 0
+        self.ticks = 0
+
+    def post(self, view, lid, text, delay=0, timeout=None, log=None):
+        """
+        Show text (or erase the status if text is None) for the status id
+        lid in the view after delay milliseconds, erasing it after timeout
+        milliseconds. log is called with no arguments when it's shown.
+
+        """
+        now = time.time()
+        show_at = now + (delay or 0) / 1000.0
+        expire_at = show_at + timeout / 1000.0 if timeout is not None else None
+        key = (view.id(), lid)
+        with self.lock:
+            self.posted += 1
+            shown = self.shown.get(key)
+            if shown and shown[1] == text and key not in self.pending:
+                return
+            self.pending[key] = (view, text, show_at, expire_at, log)
+            timer = self._schedule(show_at, now)
+        self._start(timer)
+
+    def _schedule(self, at, now):
+        """
+        Set the timer to tick at the given time, unless it's already set to
+        tick before that. Returns (timer id, delay) of a timer to start, or
+        None. Must be called with the lock held.
+
+        """
+        if self.next_tick is not None and self.next_tick <= at:
+            return None
+        self.next_tick = at
+        self.timer += 1
+        return self.timer, max(0, int(math.ceil((at - now) * 1000)))
+
+    def _start(self, timer):
+        if timer is not None:
+            timer, delay = timer
+            sublime.set_timeout(lambda: self.tick(timer), delay)
+
+    def tick(self, timer=None):
+        now = time.time()
+        show = []
+        erase = []
+        with self.lock:
+            if timer is not None and timer != self.timer:
+                return  # superseded by a timer set to tick earlier
+            self.next_tick = None
+            self.ticks += 1
+            for key, (view, text, show_at, expire_at, log) in list(self.pending.items()):
+                if show_at <= now:
+                    del self.pending[key]
+                    if text is None:
+                        if self.shown.pop(key, None):
+                            erase.append((view, key[1]))
+                    else:
+                        self.shown[key] = (view, text, expire_at)
+                        show.append((view, key[1], text, log))
+            for key, (view, text, expire_at) in list(self.shown.items()):
+                if expire_at is not None and expire_at <= now:
+                    del self.shown[key]
+                    erase.append((view, key[1]))
+            due = [e[2] for e in self.pending.values()]
+            due.extend(e[2] for e in self.shown.values() if e[2] is not None)
+            timer = self._schedule(min(due), now) if due else None
+
+        for view, lid, text, log in show:
+            if log:
+                log()
+            view.set_status(lid, text)
+        for view, lid in erase:
+            view.erase_status(lid)
+
+        self._start(timer)
+
+    def stats(self):
+        return {
+            'posted': self.posted,
+            'ticks': self.ticks,
+            'pending': len(self.pending),
+            'shown': len(self.shown),
+        }
+
+
+class NotificationAggregator(object):
+    """
+    Throttles the notifications coming from the backend to the UI thread.
+
+    Progress notifications of a scan are merged per scan, the latest one
+    replacing older ones, and delivered at most `rate` times per second.
+    Everything else (log records, messages, errors) is delivered as it
+    comes, in its own UI callback.
+    Counters of the traffic, the backlog and the rate at which buffers are
+    being scanned are kept for reporting.
+
+    """
+    RATE_WINDOW = 10.0  # seconds used to compute the scan rate
+
+    def __init__(self, rate=4):
+        self.lock = threading.Lock()
+        self.interval = 1000 // rate
+        self.pending = {}  # map of (topic, scan) -> (order, topic, data)
+        self.order = 0
+        self.scheduled = False
+        self.received = 0
+        self.merged = 0
+        self.delivered = 0
+        self.errors = 0
+        self.scanned = 0
+        self.scanned_times = deque(maxlen=4096)
+
+    def configure(self, rate):
+        self.interval = 1000 // max(1, rate)
+
+    def scan(self):
+        """Account for a buffer scanned by the backend."""
+        with self.lock:
+            self.scanned += 1
+            self.scanned_times.append(time.time())
+
+    @staticmethod
+    def progress_key(topic, data):
+        """Return the merge key of a progress notification of a scan, or None."""
+        if topic != 'status_message' or data.get('type') == 'logging':
+            return None
+        scan = data.get('scan')
+        if scan is None or data.get('progress') is None and data.get('completed') is None:
+            return None
+        return topic, scan
+
+    def receive(self, topic, data, deliver, urgent=False):
+        """
+        Queue the notification to be delivered, by calling deliver(topic,
+        data) in the UI thread. Progress of a scan is merged with the
+        pending progress of the same scan; anything else is delivered right
+        away (urgent ones being errors).
+
+        """
+        key = self.progress_key(topic, data)
+        with self.lock:
+            self.received += 1
+            if key is None:
+                if urgent:
+                    self.errors += 1
+                self.delivered += 1
+            else:
+                if key in self.pending:
+                    self.merged += 1
+                self.order += 1
+                self.pending[key] = (self.order, topic, data)
+                if self.scheduled:
+                    return
+                self.scheduled = True
+
+        if key is None:
+            sublime.set_timeout(lambda: deliver(topic, data), 0)
+        else:
+            sublime.set_timeout(lambda: self.flush(deliver), self.interval)
+
+    def flush(self, deliver):
+        with self.lock:
+            pending = sorted(self.pending.values())
+            self.pending.clear()
+            self.scheduled = False
+            self.delivered += len(pending)
+        for order, topic, data in pending:
+            deliver(topic, data)
+
+    def scan_rate(self):
+        """Buffers scanned per second during the last RATE_WINDOW seconds."""
+        since = time.time() - self.RATE_WINDOW
+        with self.lock:
+            recent = sum(1 for t in self.scanned_times if t >= since)
+        return recent / self.RATE_WINDOW
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'merged': self.merged,
+            'delivered': self.delivered,
+            'errors': self.errors,
+            'backlog': len(self.pending),
+            'scanned': self.scanned,
+            'scanned_per_second': round(self.scan_rate(), 2),
+        }
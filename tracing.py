@@ -0,0 +1,147 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import json
+import math
+import time
+import logging
+import threading
+from collections import deque, defaultdict, OrderedDict
+
+timer = getattr(time, 'perf_counter', time.time)
+
+logger = logging.getLogger('CodeIntel.tracing')
+
+
+class Trace(object):
+    """
+    Timing spans of a single request.
+
+    Each call to mark() closes the span of the stage that just finished,
+    measured from the previous mark (or from the creation of the trace).
+
+    """
+
+    def __init__(self, tracer, kind, lang=None):
+        self.tracer = tracer
+        self.kind = kind
+        self.lang = lang
+        self.status = None
+        self.started = time.time()
+        self.start = self.last = timer()
+        self.spans = []  # list of (stage, milliseconds)
+
+    def mark(self, stage):
+        now = timer()
+        self.spans.append((stage, (now - self.last) * 1000.0))
+        self.last = now
+
+    def finish(self, stage=None, status='served'):
+        if self.status is not None:
+            return
+        if stage:
+            self.mark(stage)
+        self.status = status
+        self.tracer.record(self)
+
+    @property
+    def total(self):
+        return (self.last - self.start) * 1000.0
+
+    def to_dict(self):
+        return {
+            'time': self.started,
+            'kind': self.kind,
+            'lang': self.lang,
+            'status': self.status,
+            'total': self.total,
+            'spans': self.spans,
+        }
+
+
+class NullTrace(object):
+    """Trace that records nothing, used when tracing is disabled."""
+    kind = lang = status = None
+
+    def mark(self, stage):
+        pass
+
+    def finish(self, stage=None, status='served'):
+        pass
+
+
+class Tracer(object):
+    """
+    Keeps the most recent request traces in a ring buffer and computes
+    latency percentiles per request kind, language and stage. Finished
+    traces are optionally appended to a JSONL file.
+
+    """
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, size=1000, path=None):
+        self.lock = threading.Lock()
+        self.traces = deque(maxlen=size)
+        self.path = path
+        self.enabled = True
+
+    def configure(self, size=None, path=None, enabled=True):
+        with self.lock:
+            if size is not None and size != self.traces.maxlen:
+                self.traces = deque(self.traces, maxlen=size)
+            self.path = path or None
+            self.enabled = enabled
+
+    def trace(self, kind, lang=None):
+        if not self.enabled:
+            return NullTrace()
+        return Trace(self, kind, lang)
+
+    def record(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+            path = self.path
+        if path:
+            try:
+                with io.open(path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(trace.to_dict()) + '\n')
+            except (IOError, OSError) as e:
+                logger.warning("Cannot write trace to %r: %s", path, e)
+
+    @staticmethod
+    def percentile(values, p):
+        """Nearest rank percentile of an already sorted list."""
+        index = int(math.ceil(p / 100.0 * len(values))) - 1
+        return values[max(0, min(len(values) - 1, index))]
+
+    def stats(self):
+        """
+        Return a list of (kind, lang, stage, count, p50, p95, p99) for the
+        served requests, the 'total' stage being the whole request.
+
+        """
+        with self.lock:
+            traces = list(self.traces)
+
+        samples = OrderedDict()
+        for trace in traces:
+            if trace.status != 'served':
+                continue
+            for stage, ms in trace.spans:
+                samples.setdefault((trace.kind, trace.lang, stage), []).append(ms)
+            samples.setdefault((trace.kind, trace.lang, 'total'), []).append(trace.total)
+
+        stats = []
+        for (kind, lang, stage), values in samples.items():
+            values.sort()
+            stats.append((kind, lang, stage, len(values)) + tuple(self.percentile(values, p) for p in self.PERCENTILES))
+        return stats
+
+    def counts(self):
+        """Return the number of recent traces by status."""
+        with self.lock:
+            traces = list(self.traces)
+        counts = defaultdict(int)
+        for trace in traces:
+            counts[trace.status] += 1
+        return dict(counts)
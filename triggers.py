@@ -0,0 +1,119 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import threading
+
+
+# Characters after which CodeIntel can trigger, the length of the
+# identifiers it triggers on (as (min, max), max None for no limit) and the
+# sigils after which the first identifier character triggers, for the
+# languages whose triggers are known; anything else is forwarded.
+TRIGGERS = {
+    'Python': {'chars': ' (._@'},
+    'Python3': {'chars': ' (._@'},
+    'JavaScript': {'chars': '.(,@\'" ', 'names': (3, 3)},
+    'Node.js': {'chars': '.(,@\'" ', 'names': (3, 3)},
+    'PHP': {'chars': '$>:(,@"\' \\', 'names': (3, 3), 'sigils': '$'},
+    'Ruby': {'chars': '. (:@$"\'/', 'names': (3, None)},
+    'Perl': {'chars': ' (>:$'},
+}
+
+DEFAULT_STOP_CHARS = "~`!@#$%^&*()-=+{}[]|\\;:'\",.<>?/ "
+WHITESPACE = ' \t\r\n'
+
+
+class TriggerFilter(object):
+    """
+    Decides locally whether a live trigger can possibly happen at a given
+    position, so keystrokes that can't trigger anything don't cost a
+    buffer sync and a round trip to the backend.
+
+    The table of each language is built once, from the known trigger
+    characters and the identifier rules given by the backend (identifiers
+    are made of anything but the language's completion stop characters).
+
+    """
+    LOOKBEHIND = 5  # characters before the cursor needed to decide
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}  # map of lang -> table (None if unknown)
+        self.skipped = 0
+        self.forwarded = 0
+        self.unknown = 0
+
+    def table(self, lang, languages):
+        try:
+            return self.tables[lang]
+        except KeyError:
+            pass
+        triggers = TRIGGERS.get(lang)
+        if triggers is None:
+            table = None
+        else:
+            info = languages.get(lang) or {}
+            stop_chars = info.get('cpln_stop_chars') or DEFAULT_STOP_CHARS
+            names = triggers.get('names')
+            table = {
+                'chars': frozenset(triggers['chars']),
+                'stop_chars': frozenset(stop_chars + WHITESPACE),
+                'min': names[0] if names else None,
+                'max': names[1] if names else None,
+                'sigils': frozenset(triggers.get('sigils', '')),
+            }
+        self.tables[lang] = table
+        return table
+
+    def can_trigger(self, lang, text, languages):
+        """
+        Whether typing the last character of text (the text right before
+        the cursor, at least LOOKBEHIND characters of it if available) can
+        trigger in the language. languages is the backend's language info.
+
+        """
+        table = self.table(lang, languages)
+        if table is None:
+            with self.lock:
+                self.unknown += 1
+                self.forwarded += 1
+            return True
+
+        possible = self._can_trigger(table, text)
+        with self.lock:
+            if possible:
+                self.forwarded += 1
+            else:
+                self.skipped += 1
+        return possible
+
+    def _can_trigger(self, table, text):
+        if not text:
+            return False
+        if text[-1] in table['chars']:
+            return True
+        stop_chars = table['stop_chars']
+        if text[-1] in stop_chars:
+            return False
+        # Typing an identifier, find out how long it is so far:
+        length = 0
+        for ch in reversed(text):
+            if ch in stop_chars:
+                break
+            length += 1
+        if length == 1 and len(text) > 1 and text[-2] in table['sigils']:
+            return True
+        if table['min'] is None:
+            return False
+        return length >= table['min'] and (table['max'] is None or length <= table['max'])
+
+    def forget(self):
+        """Forget the tables (e.g. when the backend restarts)."""
+        self.tables.clear()
+
+    def stats(self):
+        total = self.skipped + self.forwarded
+        return {
+            'skipped': self.skipped,
+            'forwarded': self.forwarded,
+            'unknown_language': self.unknown,
+            'skipped_ratio': round(float(self.skipped) / total, 3) if total else None,
+        }
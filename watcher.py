@@ -0,0 +1,278 @@
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+
+from .pathmatch import PathMatcher
+
+logger = logging.getLogger('CodeIntel.watcher')
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+
+EVENT = struct.Struct(str('iIII'))  # wd, mask, cookie, len
+
+
+def load_inotify():
+    """Return the libc with the inotify functions, or None if not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (ImportError, OSError, AttributeError):
+        return None
+    return libc
+
+
+class Watcher(object):
+    """
+    Watches the indexed directories for files changed outside the editor.
+
+    With inotify (Linux), every directory the indexer walks is watched.
+    Change events are collected and deduplicated until no new events come
+    for DEBOUNCE seconds (or for at most MAX_WAIT seconds during a burst,
+    such as a branch switch), then the whole batch of changed files and new
+    directories, and of deleted (or moved away) files and directories, is
+    handed over at once as callback(paths, deleted). Events for excluded
+    paths are ignored. When the queue of events overflows,
+    callback(None, ()) asks for everything to be rescanned.
+
+    Without inotify (or when running out of watches) it falls back to
+    polling: callback(None, ()) is called every `poll_interval` seconds.
+
+    """
+    DEBOUNCE = 0.5
+    MAX_WAIT = 5.0
+
+    def __init__(self, callback, mode='auto', poll_interval=60):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.mode = None
+        self.requested_mode = mode
+        self.poll_interval = poll_interval
+        self.exclude = PathMatcher()
+        self.libc = None
+        self.fd = None
+        self.watches = {}  # map of watch descriptor -> directory
+        self.watched = set()
+        self.pending = set()
+        self.deleted = set()
+        self.first_event = None
+        self.last_event = None
+        self.last_poll = time.time()
+        self.thread = None
+        self.stopped = False
+        self.events = 0
+        self.ignored = 0
+        self.batches = 0
+        self.overflows = 0
+        self.polls = 0
+
+    def configure(self, mode='auto', poll_interval=60, exclude=None):
+        with self.lock:
+            self.requested_mode = mode
+            self.poll_interval = poll_interval
+            if exclude is not None:
+                self.exclude = exclude
+            if self.mode is not None and mode not in ('auto', self.mode):
+                self._close()
+                self.mode = None
+
+    def _open(self):
+        mode = self.requested_mode
+        if mode in ('auto', 'inotify'):
+            self.libc = load_inotify()
+            if self.libc:
+                fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                if fd >= 0:
+                    self.fd = fd
+                    self.mode = 'inotify'
+                    return
+            logger.info("inotify is not available, polling for changes instead")
+            mode = 'poll'
+        self.mode = mode
+
+    def _close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+        self.watches.clear()
+        self.watched.clear()
+
+    def watch(self, directory):
+        """Watch a directory (called by the indexer for every directory walked)."""
+        with self.lock:
+            if self.stopped:
+                return
+            if self.mode is None:
+                self._open()
+            if self.mode == 'inotify' and directory not in self.watched:
+                path = directory.encode(sys.getfilesystemencoding() or 'utf-8')
+                wd = self.libc.inotify_add_watch(self.fd, path, WATCH_MASK)
+                if wd >= 0:
+                    self.watches[wd] = directory
+                    self.watched.add(directory)
+                else:
+                    err = self._errno()
+                    if err == errno.ENOSPC:
+                        logger.warning("Out of inotify watches (see fs.inotify.max_user_watches), polling for changes instead")
+                        self._close()
+                        self.mode = 'poll'
+        self.start()
+
+    def _errno(self):
+        import ctypes
+        return ctypes.get_errno()
+
+    def start(self):
+        if self.stopped or self.mode in (None, 'off'):
+            return
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='CodeIntel Watcher')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self._close()
+
+    def run(self):
+        while not self.stopped:
+            mode = self.mode
+            if mode == 'inotify':
+                self._read()
+            elif mode == 'poll':
+                wait = self.last_poll + self.poll_interval - time.time()
+                if wait > 0:
+                    time.sleep(min(wait, 1.0))
+                    continue
+                self.last_poll = time.time()
+                self.polls += 1
+                self.callback(None, ())
+            else:
+                break
+            self._flush()
+
+    def _read(self):
+        fd = self.fd
+        if fd is None:
+            return
+        try:
+            readable = select.select([fd], [], [], 1.0 if self.first_event is None else self.DEBOUNCE)[0]
+            data = os.read(fd, 64 * 1024) if readable else b''
+        except (OSError, IOError, ValueError) as e:
+            if getattr(e, 'errno', None) not in (errno.EAGAIN, errno.EINTR):
+                if not self.stopped:
+                    logger.warning("Error reading inotify events: %s", e)
+                time.sleep(1.0)
+            return
+        if not data:
+            return
+
+        now = time.time()
+        encoding = sys.getfilesystemencoding() or 'utf-8'
+        overflow = False
+        offset = 0
+        with self.lock:
+            while offset + EVENT.size <= len(data):
+                wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+                offset += EVENT.size + length
+                self.events += 1
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF):
+                    if mask & IN_IGNORED:
+                        del self.watches[wd]
+                        self.watched.discard(directory)
+                    continue
+                if not name:
+                    continue
+                name = name.decode(encoding, 'replace')
+                if name.startswith('.'):
+                    continue
+                deleted = mask & (IN_DELETE | IN_MOVED_FROM)
+                if not deleted:
+                    if mask & IN_ISDIR:
+                        if not mask & (IN_CREATE | IN_MOVED_TO):
+                            continue
+                    elif not mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        continue
+                path = os.path.join(directory, name)
+                if self.exclude.excluded(path):
+                    self.ignored += 1
+                    continue
+                if deleted:
+                    self.pending.discard(path)
+                    self.deleted.add(path)
+                else:
+                    self.deleted.discard(path)
+                    self.pending.add(path)
+            if overflow:
+                self.overflows += 1
+                self.pending = set()
+                self.deleted = set()
+            if self.first_event is None:
+                self.first_event = now
+            self.last_event = now
+        if overflow:
+            self.callback(None, ())
+
+    def _flush(self):
+        now = time.time()
+        with self.lock:
+            if self.first_event is None:
+                return
+            if now - self.last_event < self.DEBOUNCE and now - self.first_event < self.MAX_WAIT:
+                return
+            pending, self.pending = self.pending, set()
+            deleted, self.deleted = self.deleted, set()
+            self.first_event = self.last_event = None
+            if pending or deleted:
+                self.batches += 1
+        if pending or deleted:
+            self.callback(sorted(pending), sorted(deleted))
+
+    def stats(self):
+        return {
+            'mode': self.mode or self.requested_mode,
+            'watches': len(self.watches),
+            'events': self.events,
+            'ignored': self.ignored,
+            'pending': len(self.pending) + len(self.deleted),
+            'batches': self.batches,
+            'overflows': self.overflows,
+            'polls': self.polls,
+        }